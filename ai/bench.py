@@ -0,0 +1,300 @@
+"""
+Benchmark the PII scrubbers on synthetic emails.
+
+    python bench.py suite --sizes 100 1000 --densities 0.01 0.05 0.2
+    python bench.py vectorised --rows 1000000
+
+`suite` runs each scrubber over synthetic corpora of different sizes and name
+densities, and reports throughput, p50/p99 latency per email, memory and the startup
+time of importing `utils` and loading the scrubbers. Each run happens in a fresh
+process, so its peak RSS only covers the models that scrubber loads, and the growth of
+the peak during the timed loop is reported as well. Results can be saved with `--json`
+and compared against a previous run with `--baseline`, which fails if a scrubber got
+slower than the tolerance allows. `--profile-dir` writes a cProfile dump per scrubber,
+from a second pass over the emails that isn't timed.
+
+`vectorised` compares scrubbing a column row by row with `Series.apply` against the
+vectorised `scrub_email_addresses_series` and `scrub_names_series`.
+"""
+import argparse
+import cProfile
+import json
+import multiprocessing
+import random
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from utils import (
+    _get_name_matcher,
+    _scrub_names_names_dataset,
+    _scrub_names_spacy,
+    load_scrubbers,
+    scrub_email_addresses,
+    scrub_email_addresses_series,
+    scrub_names,
+    scrub_names_series,
+)
+
+NAMES = ["John", "Sarah", "Dom", "Priya", "Mohammed", "Emma", "Smith", "Jones"]
+WORDS = (
+    "thanks for the help with this order refund delivery account password please "
+    "could you let me know when it arrives invoice attached again today"
+).split()
+
+SCRUBBERS = {
+    "scrub_email_addresses": scrub_email_addresses,
+    "_scrub_names_spacy": _scrub_names_spacy,
+    "_scrub_names_names_dataset": _scrub_names_names_dataset,
+    "scrub_names": scrub_names,
+}
+
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import utils
+imported = time.perf_counter()
+utils.load_scrubbers()
+loaded = time.perf_counter()
+print(json.dumps({"import_seconds": imported - start, "load_seconds": loaded - imported}))
+"""
+
+
+def make_bodies(count, words_per_email=40, name_density=0.05, seed=0):
+    """
+    Make `count` synthetic email bodies, where roughly `name_density` of the words are
+    names and each email has an email address in it.
+    """
+    rng = random.Random(seed)
+    bodies = []
+    for i in range(count):
+        words = [
+            rng.choice(NAMES) if rng.random() < name_density else rng.choice(WORDS)
+            for _ in range(words_per_email)
+        ]
+        words.insert(rng.randrange(len(words) + 1), "user{}@example.com".format(i))
+        bodies.append(
+            "Hi {},\n\n{}\n\nBest,\n\n{}".format(
+                rng.choice(NAMES), " ".join(words), rng.choice(NAMES)
+            )
+        )
+    return bodies
+
+
+def _time(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def _percentile(sorted_values, percentile):
+    index = round(percentile / 100 * (len(sorted_values) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    if sys.platform == "darwin":
+        peak /= 1024
+    return peak / 1024
+
+
+def measure_startup():
+    """Time importing `utils` and loading the scrubbers in a fresh interpreter."""
+    output = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def measure(scrubber, bodies, profile_path=None):
+    # Load whatever the scrubber loads lazily before the clock starts
+    scrubber(bodies[0])
+    peak_before = peak_rss_mb()
+
+    latencies = []
+    start = time.perf_counter()
+    for body in bodies:
+        body_start = time.perf_counter()
+        scrubber(body)
+        latencies.append(time.perf_counter() - body_start)
+    seconds = time.perf_counter() - start
+    peak_after = peak_rss_mb()
+
+    # Profile a separate pass, so the profiler's overhead never ends up in the timings
+    if profile_path:
+        profile = cProfile.Profile()
+        profile.enable()
+        for body in bodies:
+            scrubber(body)
+        profile.disable()
+        profile.dump_stats(profile_path)
+
+    latencies.sort()
+    return {
+        "emails_per_second": len(bodies) / seconds,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "peak_rss_mb": peak_after,
+        "rss_growth_mb": peak_after - peak_before,
+    }
+
+
+def _measure_run(name, size, density, profile_path):
+    return measure(SCRUBBERS[name], make_bodies(size, name_density=density), profile_path)
+
+
+def run_suite(sizes, densities, scrubbers, profile_dir=None):
+    results = {"startup": measure_startup(), "runs": []}
+    if profile_dir:
+        Path(profile_dir).mkdir(parents=True, exist_ok=True)
+
+    # A new process per run, as the peak RSS of a process never goes back down
+    context = multiprocessing.get_context("spawn")
+    for size in sizes:
+        for density in densities:
+            for name in scrubbers:
+                profile_path = None
+                if profile_dir:
+                    profile_path = Path(profile_dir) / "{}-{}-{}.prof".format(
+                        name, size, density
+                    )
+                with context.Pool(1) as pool:
+                    run = pool.apply(_measure_run, (name, size, density, profile_path))
+                run.update({"scrubber": name, "size": size, "name_density": density})
+                results["runs"].append(run)
+    return results
+
+
+def print_results(results):
+    startup = results["startup"]
+    print(
+        "Startup: import {:.2f}s, load scrubbers {:.2f}s\n".format(
+            startup["import_seconds"], startup["load_seconds"]
+        )
+    )
+    print(
+        "{:<28} {:>7} {:>8} {:>12} {:>9} {:>9} {:>9} {:>9}".format(
+            "scrubber",
+            "emails",
+            "density",
+            "emails/sec",
+            "p50 ms",
+            "p99 ms",
+            "RSS MB",
+            "+RSS MB",
+        )
+    )
+    for run in results["runs"]:
+        print(
+            "{:<28} {:>7} {:>8} {:>12,.0f} {:>9.3f} {:>9.3f} {:>9.0f} {:>9.1f}".format(
+                run["scrubber"],
+                run["size"],
+                run["name_density"],
+                run["emails_per_second"],
+                run["p50_ms"],
+                run["p99_ms"],
+                run["peak_rss_mb"],
+                run["rss_growth_mb"],
+            )
+        )
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    Return a message for every run whose throughput dropped by more than `tolerance`, as
+    a fraction, compared to the same run in `baseline`.
+    """
+
+    def key(run):
+        return run["scrubber"], run["size"], run["name_density"]
+
+    baseline_runs = {key(run): run for run in baseline["runs"]}
+    regressions = []
+    for run in results["runs"]:
+        previous = baseline_runs.get(key(run))
+        if previous is None:
+            continue
+        ratio = run["emails_per_second"] / previous["emails_per_second"]
+        if ratio < 1 - tolerance:
+            regressions.append(
+                "{} ({} emails, density {}): {:,.0f} emails/sec, was {:,.0f}".format(
+                    *key(run), run["emails_per_second"], previous["emails_per_second"]
+                )
+            )
+    return regressions
+
+
+def compare_vectorised(rows):
+    load_scrubbers()
+    # The regex of every name is compiled once, on first use, so keep it out of the timings
+    _, compile_seconds = _time(lambda: _get_name_matcher().pattern)
+    print("Compiled the names regex in {:.2f}s\n".format(compile_seconds))
+    bodies = pd.Series(make_bodies(rows))
+
+    print("{:<10} {:<12} {:>10} {:>14}".format("scrubber", "method", "seconds", "rows/sec"))
+    for name, per_row, vectorised in [
+        ("email", scrub_email_addresses, scrub_email_addresses_series),
+        ("names", _scrub_names_names_dataset, scrub_names_series),
+    ]:
+        applied, applied_seconds = _time(bodies.apply, per_row)
+        series, series_seconds = _time(vectorised, bodies)
+        for method, seconds in [("apply", applied_seconds), ("vectorised", series_seconds)]:
+            print(
+                "{:<10} {:<12} {:>10.2f} {:>14,.0f}".format(
+                    name, method, seconds, rows / seconds
+                )
+            )
+        print("{:<10} {:<12} {:>10}".format(name, "same output", str(applied.equals(series))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    suite = commands.add_parser("suite", help="Benchmark each scrubber")
+    suite.add_argument("--sizes", type=int, nargs="+", default=[100, 1000])
+    suite.add_argument("--densities", type=float, nargs="+", default=[0.01, 0.05, 0.2])
+    suite.add_argument("--scrubbers", nargs="+", choices=SCRUBBERS, default=list(SCRUBBERS))
+    suite.add_argument("--profile-dir", help="Write a cProfile dump per run here")
+    suite.add_argument("--json", help="Save the results to this file")
+    suite.add_argument("--baseline", help="Results of an earlier run to compare against")
+    suite.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Largest drop in throughput allowed against the baseline",
+    )
+
+    vectorised = commands.add_parser("vectorised", help="Compare apply and vectorised scrubbing")
+    vectorised.add_argument("--rows", type=int, default=1_000_000)
+
+    args = parser.parse_args()
+    if args.command == "vectorised":
+        compare_vectorised(args.rows)
+        return
+
+    results = run_suite(args.sizes, args.densities, args.scrubbers, args.profile_dir)
+    print_results(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            print("Regression: {}".format(regression))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
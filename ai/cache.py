@@ -0,0 +1,110 @@
+"""
+A small persistent key-value cache stored in SQLite.
+"""
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+
+
+def hash_key(*parts):
+    """Hash `parts` into a fixed length key, e.g. the scrubber configuration and a text."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Map string keys to string values in a SQLite database.
+
+    Once there are more than `max_entries` entries, the least recently used ones are
+    evicted. If `ttl` is set, entries older than that many seconds are treated as
+    missing. `hits` and `misses` count the lookups made since the cache was opened.
+    Several processes can share the same database file.
+    """
+
+    def __init__(self, path, max_entries=100_000, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # Evicting needs a scan of the access index, so do it every so often rather
+        # than on every write
+        self._evict_every = max(1, max_entries // 10)
+        self._writes = 0
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            self._conn.execute(
+                '''
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            '''
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)'
+            )
+
+    def get(self, key):
+        row = self._conn.execute(
+            'SELECT value, created_at FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        now = time.time()
+        if row is not None and self.ttl is not None and row[1] + self.ttl <= now:
+            with self._conn:
+                self._conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        with self._conn:
+            self._conn.execute(
+                'UPDATE cache SET accessed_at = ? WHERE key = ?', (now, key)
+            )
+        return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._conn:
+            self._conn.execute(
+                '''
+            INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at)
+            VALUES (?, ?, ?, ?)
+            ''',
+                (key, value, now, now),
+            )
+        self._writes += 1
+        if self._writes % self._evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        with self._conn:
+            if self.ttl is not None:
+                self._conn.execute(
+                    'DELETE FROM cache WHERE created_at <= ?', (time.time() - self.ttl,)
+                )
+            self._conn.execute(
+                '''
+            DELETE FROM cache WHERE key IN (
+                SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+            ''',
+                (self.max_entries,),
+            )
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,57 @@
+"""
+A stand-in for a langchain chat model, for tests and offline runs.
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class FakeCall:
+    prompt: str
+    tokens: int
+    latency: float
+
+
+class FakeLLM:
+    """
+    Answers every prompt after `latency` seconds without calling out to anything.
+
+    Each call is recorded in `calls` with its prompt, size in tokens and how long it
+    took, and `max_in_flight` tracks the most calls that were running at once. Tokens are
+    counted as whitespace separated words.
+    """
+
+    def __init__(self, latency=0.0, model_name="fake"):
+        self.latency = latency
+        self.model_name = model_name
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def get_num_tokens(self, text):
+        return len(text.split())
+
+    def _respond(self, prompt):
+        return "Summary {} of {} tokens".format(len(self.calls), self.get_num_tokens(prompt))
+
+    def predict(self, text):
+        start = time.perf_counter()
+        time.sleep(self.latency)
+        response = self._respond(text)
+        self.calls.append(FakeCall(text, self.get_num_tokens(text), time.perf_counter() - start))
+        return response
+
+    async def apredict(self, text):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        start = time.perf_counter()
+        try:
+            await asyncio.sleep(self.latency)
+            response = self._respond(text)
+            self.calls.append(
+                FakeCall(text, self.get_num_tokens(text), time.perf_counter() - start)
+            )
+            return response
+        finally:
+            self.in_flight -= 1
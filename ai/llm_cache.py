@@ -0,0 +1,57 @@
+"""
+Cache the answers of a chat model so reruns don't pay for the same prompts twice.
+"""
+import asyncio
+
+from cache import hash_key
+
+
+class CachedLLM:
+    """
+    Wrap a langchain chat model, or `fake_llm.FakeLLM`, so identical prompts are answered
+    from a `cache.DiskCache`, and identical prompts sent at the same time share a single
+    request to the model.
+
+    Prompts are keyed by the model name and the rendered prompt, which covers both the
+    template and the inputs it was rendered with.
+    """
+
+    def __init__(self, llm, cache):
+        self.llm = llm
+        self.cache = cache
+        self.model_name = getattr(llm, 'model_name', type(llm).__name__)
+        self._in_flight = {}
+
+    def get_num_tokens(self, text):
+        return self.llm.get_num_tokens(text)
+
+    def _key(self, text):
+        return hash_key(self.model_name, text)
+
+    def predict(self, text):
+        key = self._key(text)
+        response = self.cache.get(key)
+        if response is None:
+            response = self.llm.predict(text)
+            self.cache.set(key, response)
+        return response
+
+    async def _request(self, key, text):
+        response = await self.llm.apredict(text)
+        self.cache.set(key, response)
+        return response
+
+    async def apredict(self, text):
+        key = self._key(text)
+        response = self.cache.get(key)
+        if response is not None:
+            return response
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._request(key, text))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Shield the shared request so one caller being cancelled doesn't cancel it for
+        # everyone else waiting on it
+        return await asyncio.shield(task)
@@ -0,0 +1,57 @@
+"""
+Build and load the list of high rank names used to scrub emails.
+
+Walking every name in names-dataset takes several seconds and a few GB of memory, so
+the names ranked under the threshold in at least one country are written once to a
+text file, one name per line, and read back from there. The file name includes the
+names-dataset version and the rank threshold, so changing either builds a new index.
+
+Run `python name_index.py` to build the index ahead of time.
+"""
+import os
+from importlib.metadata import version
+from pathlib import Path
+
+RANK_THRESHOLD = 1000
+CACHE_DIR = Path(__file__).parent / '.cache'
+
+
+def index_path(rank_threshold=RANK_THRESHOLD, cache_dir=CACHE_DIR):
+    return Path(cache_dir) / 'names-{}-rank{}.txt'.format(
+        version('names-dataset'), rank_threshold
+    )
+
+
+def _high_rank_names(names, rank_threshold):
+    for name, name_data in names.items():
+        if any(rank < rank_threshold for rank in name_data['rank'].values()):
+            yield name
+
+
+def build_name_index(rank_threshold=RANK_THRESHOLD, cache_dir=CACHE_DIR):
+    # The library takes time to initialize because the database is massive
+    from names_dataset import NameDataset
+
+    nd = NameDataset()
+    names = set(_high_rank_names(nd.first_names, rank_threshold))
+    names.update(_high_rank_names(nd.last_names, rank_threshold))
+
+    path = index_path(rank_threshold, cache_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first so that processes building the index at the same
+    # time never read a half written file
+    tmp_path = path.with_suffix('.{}.tmp'.format(os.getpid()))
+    tmp_path.write_text('\n'.join(sorted(names)), encoding='utf-8')
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_name_index(rank_threshold=RANK_THRESHOLD, cache_dir=CACHE_DIR):
+    path = index_path(rank_threshold, cache_dir)
+    if not path.exists():
+        build_name_index(rank_threshold, cache_dir)
+    return path.read_text(encoding='utf-8').split('\n')
+
+
+if __name__ == '__main__':
+    print('Name index written to {}'.format(build_name_index()))
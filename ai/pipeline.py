@@ -0,0 +1,148 @@
+"""
+Scrub a conversation export without loading it all into memory.
+
+The CSV is read in chunks, filtered down to the conversations of interest and the
+chunks are scrubbed on a pool of worker processes. Each worker loads the name index and
+the spacy model once, and scrubbed chunks are written out in their original order as
+soon as they are ready. Workers can share a cache of scrubbed bodies, so quoted replies
+and reruns over the same conversations skip the scrubbers.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from tqdm import tqdm
+
+from cache import DiskCache
+from utils import (
+    load_scrubbers,
+    scrub_email_addresses,
+    scrub_names_many,
+    use_scrub_cache,
+)
+
+COLUMNS = ['ConvID', 'createdAt', 'body_clean', 'customer.id', 'createdBy.id']
+
+_worker_cache = None
+
+
+def find_conversation_ids(path, month, limit=None, chunksize=100_000):
+    """
+    Return the ids of conversations with a message created in `month` (e.g. "2023-08"),
+    in the order they first appear in the file.
+    """
+    # A dict rather than a set so the ids keep the order they were found in
+    conversation_ids = {}
+    for chunk in pd.read_csv(path, usecols=['ConvID', 'createdAt'], chunksize=chunksize):
+        in_month = chunk['createdAt'].str.contains(month, na=False)
+        for conversation_id in chunk.loc[in_month, 'ConvID'].unique():
+            conversation_ids[conversation_id] = None
+            if limit is not None and len(conversation_ids) >= limit:
+                return list(conversation_ids)
+    return list(conversation_ids)
+
+
+def iter_conversation_chunks(path, conversation_ids, chunksize=1000):
+    conversation_ids = set(conversation_ids)
+    for chunk in pd.read_csv(path, usecols=COLUMNS, chunksize=chunksize):
+        chunk = chunk[chunk['ConvID'].isin(conversation_ids)]
+        if len(chunk):
+            yield chunk[COLUMNS]
+
+
+def iter_new_message_chunks(path, watermarks, chunksize=1000):
+    """
+    Yield the messages created after the watermark of their conversation, where
+    `watermarks` maps conversation ids, as strings, to the latest `createdAt` already
+    processed. Conversations without a watermark are yielded in full.
+    """
+    for chunk in pd.read_csv(path, usecols=COLUMNS, chunksize=chunksize):
+        # createdAt values are ISO 8601 timestamps, so they sort as strings
+        watermark = chunk['ConvID'].astype(str).map(watermarks).fillna('')
+        chunk = chunk[chunk['createdAt'].fillna('') > watermark]
+        if len(chunk):
+            yield chunk[COLUMNS]
+
+
+def scrub_chunk(chunk, batch_size=64):
+    bodies = chunk['body_clean'].fillna('').map(scrub_email_addresses)
+    return chunk.assign(body_clean=scrub_names_many(bodies, batch_size=batch_size))
+
+
+def _init_worker(cache_path):
+    global _worker_cache
+    load_scrubbers()
+    if cache_path is not None:
+        _worker_cache = DiskCache(cache_path)
+        use_scrub_cache(_worker_cache)
+
+
+def _scrub_chunk_in_worker(chunk):
+    """Scrub `chunk` and return it with the number of cache hits and misses it caused."""
+    if _worker_cache is None:
+        return scrub_chunk(chunk), 0, 0
+    hits, misses = _worker_cache.hits, _worker_cache.misses
+    chunk = scrub_chunk(chunk)
+    return chunk, _worker_cache.hits - hits, _worker_cache.misses - misses
+
+
+def scrub_chunks(chunks, output_path, workers=None, cache_path=None):
+    """
+    Scrub an iterable of message chunks and write them to `output_path`. If `cache_path`
+    is given, scrubbed bodies are cached in a `DiskCache` at that path. Returns the
+    number of rows written.
+    """
+    workers = workers or os.cpu_count()
+    rows = hits = misses = 0
+
+    with open(output_path, 'w', newline='') as outfile, ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(cache_path,)
+    ) as executor, tqdm(unit='rows') as progress:
+
+        def write(future):
+            nonlocal rows, hits, misses
+            chunk, chunk_hits, chunk_misses = future.result()
+            chunk.to_csv(outfile, header=rows == 0, index=False)
+            rows += len(chunk)
+            hits += chunk_hits
+            misses += chunk_misses
+            progress.update(len(chunk))
+            if cache_path is not None:
+                progress.set_postfix(cache_hits=hits, cache_misses=misses)
+
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_scrub_chunk_in_worker, chunk))
+            # Only keep a couple of chunks queued per worker so memory stays bounded
+            if len(pending) >= 2 * workers:
+                write(pending.popleft())
+        while pending:
+            write(pending.popleft())
+        if rows == 0:
+            pd.DataFrame(columns=COLUMNS).to_csv(outfile, index=False)
+
+    return rows
+
+
+def scrub_csv(
+    path, output_path, month, limit=None, workers=None, chunksize=1000, cache_path=None
+):
+    """
+    Scrub every message of the conversations found by `find_conversation_ids` and write
+    them to `output_path`. Returns the number of rows written.
+    """
+    conversation_ids = find_conversation_ids(path, month, limit)
+    chunks = iter_conversation_chunks(path, conversation_ids, chunksize)
+    return scrub_chunks(chunks, output_path, workers, cache_path)
+
+
+def scrub_new_messages(
+    path, output_path, watermarks, workers=None, chunksize=1000, cache_path=None
+):
+    """
+    Scrub the messages found by `iter_new_message_chunks` and write them to
+    `output_path`. Returns the number of rows written.
+    """
+    chunks = iter_new_message_chunks(path, watermarks, chunksize)
+    return scrub_chunks(chunks, output_path, workers, cache_path)
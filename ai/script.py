@@ -1,90 +1,124 @@
 #!/usr/bin/env python
 # coding: utf-8
+import argparse
+import asyncio
 import os
 
 import pandas as pd
 from dotenv import load_dotenv
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
 from langchain.chat_models import ChatOpenAI
-from tqdm import tqdm
 
-
-from utils import scrub_email_addresses, scrub_names
-
-OPENAI_KEY = os.getenv("OPENAI_KEY")
-
-dataset = pd.read_csv("dataset.csv")
-load_dotenv()
-# Filter for conversation IDs from August 2023
-conversation_ids = dataset[dataset["createdAt"].str.contains("2023-08")][
-    "ConvID"
-].unique()
-
-conversation_ids_sample = conversation_ids[:10]
-
-# Filter dataset if conversation ID is in August 2023
-cleaned_dataset = dataset[dataset["ConvID"].isin(conversation_ids_sample)]
-cleaned_dataset = cleaned_dataset[
-    ["createdAt", "body_clean", "customer.id", "createdBy.id"]
-]
-
-tqdm.pandas()
-
-# Apply the scrub functions to the body_clean column
-cleaned_dataset["body_clean"] = cleaned_dataset["body_clean"].progress_apply(
-    scrub_email_addresses
-)
-cleaned_dataset["body_clean"] = cleaned_dataset["body_clean"].progress_apply(
-    scrub_names
-)
-
-prompt_template = """
-You are an assistant to a team of customer service representatives. You have a series of emails in key and value pairs format.
-You have been given the task of summarising the conversations in a paragraph of text.
-
-Each email is separated by a "=============================" separator and looks like this:
-
-createdAt: "2023-08-01T00:00:00.000Z"
-customer.id: "12345"
-body_clean": "This is the body of the email."
-
-Here is the input for all the emails:
-
-{email_json}
-
-You can use the following template to help you write your summary:
-
-Between the dates of X and Y, there were Z emails from our users. The emails were summarised as follows:
-
-Formatted summary as a markdown list
-"""
-
-appends = []
-for email in cleaned_dataset.to_dict(orient="records"):
-    appends.append(
-        """
-    createdAt: {createdAt}
-    customer.id: {customer_id}
-    body_clean: {body_clean}
-    """.format(
-            createdAt=email["createdAt"],
-            customer_id=email["customer.id"],
-            body_clean=email["body_clean"],
+from cache import DiskCache
+from fake_llm import FakeLLM
+from llm_cache import CachedLLM
+from pipeline import scrub_csv, scrub_new_messages
+from state import ConversationState
+from summarise import summarise, update_summaries
+
+DATASET_PATH = "dataset.csv"
+SCRUBBED_PATH = "dataset_scrubbed.csv"
+SCRUB_CACHE_PATH = ".cache/scrub_cache.db"
+LLM_CACHE_PATH = ".cache/llm_cache.db"
+LLM_CACHE_TTL = 30 * 24 * 60 * 60
+STATE_PATH = "conversations.db"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scrub and summarise support emails")
+    parser.add_argument("--month", default="2023-08", help="Month to pick conversations from")
+    parser.add_argument(
+        "--conversations", type=int, default=10, help="Number of conversations to summarise"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Scrubbing processes, defaults to one per CPU"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't reuse scrubbed emails or model responses from earlier runs",
+    )
+    parser.add_argument(
+        "--max-tokens", type=int, default=4000, help="Token budget for the emails in each prompt"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="Number of requests to the model at once"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only process emails newer than the last run and update each conversation's summary",
+    )
+    parser.add_argument(
+        "--fake-llm", action="store_true", help="Use a local fake model instead of OpenAI"
+    )
+    return parser.parse_args()
+
+
+def make_llm(args):
+    if args.fake_llm:
+        llm = FakeLLM()
+    else:
+        llm = ChatOpenAI(openai_api_key=os.getenv("OPENAI_KEY"), model="gpt-4")
+    if not args.no_cache:
+        llm = CachedLLM(llm, DiskCache(LLM_CACHE_PATH, ttl=LLM_CACHE_TTL))
+    return llm
+
+
+def run_incremental(args):
+    state = ConversationState(STATE_PATH)
+    scrub_new_messages(
+        DATASET_PATH,
+        SCRUBBED_PATH,
+        state.watermarks(),
+        workers=args.workers,
+        cache_path=None if args.no_cache else SCRUB_CACHE_PATH,
+    )
+    new_emails = pd.read_csv(SCRUBBED_PATH)
+
+    updated = asyncio.run(
+        update_summaries(
+            new_emails.to_dict(orient="records"),
+            state,
+            make_llm(args),
+            max_tokens=args.max_tokens,
+            concurrency=args.concurrency,
         )
     )
-    appends.append("=============================")
-
-prompt = PromptTemplate(
-    template=prompt_template,
-    input_variables=["email_json"],
-)
+    for conv_id in updated:
+        print("Conversation {}\n{}\n".format(conv_id, state.summary(conv_id)))
+    print("Updated the summaries of {} conversations".format(len(updated)))
+
+
+def main():
+    args = parse_args()
+    load_dotenv()
+
+    if args.incremental:
+        run_incremental(args)
+        return
+
+    # Scrub every message of the first conversations with a message in the month
+    scrub_csv(
+        DATASET_PATH,
+        SCRUBBED_PATH,
+        month=args.month,
+        limit=args.conversations,
+        workers=args.workers,
+        cache_path=None if args.no_cache else SCRUB_CACHE_PATH,
+    )
+    cleaned_dataset = pd.read_csv(SCRUBBED_PATH)
+
+    response = asyncio.run(
+        summarise(
+            cleaned_dataset.to_dict(orient="records"),
+            make_llm(args),
+            max_tokens=args.max_tokens,
+            concurrency=args.concurrency,
+        )
+    )
+    print(response)
 
-llm = ChatOpenAI(openai_api_key=OPENAI_KEY, model="gpt-4")
-llm_chain = LLMChain(prompt=prompt, llm=llm, verbose=True)
 
-response = llm_chain.run(
-    {
-        "email_json": "\n".join(appends),
-    }
-)
+# The guard stops worker processes from re-running the script when they import it
+if __name__ == "__main__":
+    main()
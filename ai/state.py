@@ -0,0 +1,54 @@
+"""
+Remember how far each conversation has been summarised between runs.
+"""
+import sqlite3
+import time
+from pathlib import Path
+
+
+class ConversationState:
+    """
+    Store, per conversation, the latest `createdAt` that has been scrubbed and summarised
+    along with the summary itself, in a SQLite database.
+    """
+
+    def __init__(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path))
+        with self._conn:
+            self._conn.execute(
+                '''
+            CREATE TABLE IF NOT EXISTS conversations (
+                conv_id TEXT PRIMARY KEY,
+                last_created_at TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            '''
+            )
+
+    def watermarks(self):
+        """Return a dict of conversation id to the latest `createdAt` summarised."""
+        return dict(
+            self._conn.execute('SELECT conv_id, last_created_at FROM conversations')
+        )
+
+    def summary(self, conv_id):
+        row = self._conn.execute(
+            'SELECT summary FROM conversations WHERE conv_id = ?', (str(conv_id),)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def update(self, conv_id, last_created_at, summary):
+        """Record the new summary of a conversation and move its watermark forward."""
+        with self._conn:
+            self._conn.execute(
+                '''
+            INSERT OR REPLACE INTO conversations (conv_id, last_created_at, summary, updated_at)
+            VALUES (?, ?, ?, ?)
+            ''',
+                (str(conv_id), last_created_at, summary, time.time()),
+            )
+
+    def close(self):
+        self._conn.close()
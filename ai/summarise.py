@@ -0,0 +1,170 @@
+"""
+Summarise more emails than fit in a single prompt.
+
+Emails are packed into chunks that fit a token budget and each chunk is summarised on
+its own, with a limited number of requests in flight at once. The partial summaries are
+then combined, as many at a time as fit the budget, until a single summary is left.
+
+`update_summaries` does the same per conversation, folding the emails that arrived
+since the last run into each conversation's stored summary.
+
+`llm` can be any langchain chat model, or anything else with `get_num_tokens(text)` and
+an async `apredict(text)` such as `fake_llm.FakeLLM`.
+"""
+import asyncio
+
+EMAIL_SEPARATOR = "============================="
+
+map_template = """
+You are an assistant to a team of customer service representatives. You have a series of emails in key and value pairs format.
+You have been given the task of summarising the conversations in a paragraph of text.
+
+Each email is separated by a "=============================" separator and looks like this:
+
+createdAt: "2023-08-01T00:00:00.000Z"
+customer.id: "12345"
+body_clean": "This is the body of the email."
+
+Here is the input for all the emails:
+
+{email_json}
+
+You can use the following template to help you write your summary:
+
+Between the dates of X and Y, there were Z emails from our users. The emails were summarised as follows:
+
+Formatted summary as a markdown list
+"""
+
+reduce_template = """
+You are an assistant to a team of customer service representatives. You have been given several summaries,
+each covering a different set of emails from our users.
+You have been given the task of combining them into a single summary.
+
+Each summary is separated by a "=============================" separator.
+
+Here are the summaries:
+
+{summaries}
+
+Add up the number of emails and use the earliest and latest dates from the summaries.
+You can use the following template to help you write your summary:
+
+Between the dates of X and Y, there were Z emails from our users. The emails were summarised as follows:
+
+Formatted summary as a markdown list
+"""
+
+
+def format_email(email):
+    return """
+    createdAt: {createdAt}
+    customer.id: {customer_id}
+    body_clean: {body_clean}
+    """.format(
+        createdAt=email["createdAt"],
+        customer_id=email["customer.id"],
+        body_clean=email["body_clean"],
+    )
+
+
+def _join(texts):
+    return "\n{}\n".format(EMAIL_SEPARATOR).join(texts)
+
+
+def pack(texts, max_tokens, count_tokens):
+    """
+    Split `texts` into consecutive chunks of at most `max_tokens` tokens. A text that is
+    larger than the budget on its own gets a chunk to itself.
+    """
+    chunks = []
+    chunk = []
+    chunk_tokens = 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if chunk and chunk_tokens + tokens > max_tokens:
+            chunks.append(chunk)
+            chunk = []
+            chunk_tokens = 0
+        chunk.append(text)
+        chunk_tokens += tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+async def _complete(llm, semaphore, template, **inputs):
+    async with semaphore:
+        return await llm.apredict(template.format(**inputs))
+
+
+async def _reduce(llm, semaphore, summaries):
+    # A summary left in a group of its own goes on to the next round as it is
+    if len(summaries) == 1:
+        return summaries[0]
+    return await _complete(llm, semaphore, reduce_template, summaries=_join(summaries))
+
+
+async def summarise(
+    emails, llm, max_tokens=4000, concurrency=4, previous_summary=None, semaphore=None
+):
+    """
+    Summarise `emails`, a list of dicts with `createdAt`, `customer.id` and `body_clean`.
+
+    `max_tokens` is the budget for the emails or summaries in each prompt, on top of the
+    template itself. At most `concurrency` requests are sent at the same time, or pass a
+    `semaphore` to share the limit between several summaries. A `previous_summary` of
+    earlier emails is combined into the result.
+    """
+    if not emails:
+        raise ValueError("There are no emails to summarise")
+
+    semaphore = semaphore or asyncio.Semaphore(concurrency)
+    chunks = pack([format_email(email) for email in emails], max_tokens, llm.get_num_tokens)
+    summaries = await asyncio.gather(
+        *(
+            _complete(llm, semaphore, map_template, email_json=_join(chunk))
+            for chunk in chunks
+        )
+    )
+    if previous_summary is not None:
+        summaries.insert(0, previous_summary)
+
+    while len(summaries) > 1:
+        groups = pack(summaries, max_tokens, llm.get_num_tokens)
+        if len(groups) == len(summaries):
+            # Every summary fills the budget by itself, so combine them in pairs to
+            # make sure each round gets closer to a single summary
+            groups = [summaries[i : i + 2] for i in range(0, len(summaries), 2)]
+        summaries = await asyncio.gather(*(_reduce(llm, semaphore, group) for group in groups))
+
+    return summaries[0]
+
+
+async def update_summaries(emails, state, llm, max_tokens=4000, concurrency=4):
+    """
+    Bring the summary of every conversation in `emails` up to date, where `emails` are
+    the new emails since the last run, as dicts with a `ConvID`, and `state` is a
+    `state.ConversationState`. Returns the ids of the conversations updated.
+    """
+    by_conversation = {}
+    for email in emails:
+        by_conversation.setdefault(email["ConvID"], []).append(email)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def update(conv_id, conversation_emails):
+        summary = await summarise(
+            conversation_emails,
+            llm,
+            max_tokens,
+            previous_summary=state.summary(conv_id),
+            semaphore=semaphore,
+        )
+        last_created_at = max(email["createdAt"] for email in conversation_emails)
+        state.update(conv_id, last_created_at, summary)
+
+    await asyncio.gather(
+        *(update(conv_id, emails) for conv_id, emails in by_conversation.items())
+    )
+    return list(by_conversation)
@@ -0,0 +1,37 @@
+from cache import DiskCache, hash_key
+
+
+def test_disk_cache_counts_hits_and_misses(tmp_path):
+    cache = DiskCache(tmp_path / "cache.db")
+    assert cache.get("key") is None
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_disk_cache_persists(tmp_path):
+    DiskCache(tmp_path / "cache.db").set("key", "value")
+    assert DiskCache(tmp_path / "cache.db").get("key") == "value"
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(tmp_path / "cache.db", max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    cache.evict()
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+
+
+def test_hash_key_separates_parts():
+    assert hash_key("ab", "c") != hash_key("a", "bc")
+
+
+def test_disk_cache_expires_entries(tmp_path):
+    cache = DiskCache(tmp_path / "cache.db", ttl=0)
+    cache.set("key", "value")
+    assert cache.get("key") is None
+    assert len(cache) == 0
@@ -0,0 +1,36 @@
+import asyncio
+
+from cache import DiskCache
+from fake_llm import FakeLLM
+from llm_cache import CachedLLM
+
+
+def test_cached_llm_reuses_responses(tmp_path):
+    llm = FakeLLM()
+    cached_llm = CachedLLM(llm, DiskCache(tmp_path / "llm.db"))
+    first = asyncio.run(cached_llm.apredict("Summarise this"))
+    second = asyncio.run(cached_llm.apredict("Summarise this"))
+    assert first == second
+    assert len(llm.calls) == 1
+
+
+def test_cached_llm_keys_on_model_name(tmp_path):
+    cache = DiskCache(tmp_path / "llm.db")
+    asyncio.run(CachedLLM(FakeLLM(model_name="a"), cache).apredict("Summarise this"))
+    llm = FakeLLM(model_name="b")
+    asyncio.run(CachedLLM(llm, cache).apredict("Summarise this"))
+    assert len(llm.calls) == 1
+
+
+def test_cached_llm_deduplicates_concurrent_prompts(tmp_path):
+    llm = FakeLLM(latency=0.01)
+    cached_llm = CachedLLM(llm, DiskCache(tmp_path / "llm.db"))
+
+    async def run():
+        return await asyncio.gather(
+            *(cached_llm.apredict("Summarise this") for _ in range(5))
+        )
+
+    responses = asyncio.run(run())
+    assert len(set(responses)) == 1
+    assert len(llm.calls) == 1
@@ -0,0 +1,14 @@
+from name_index import _high_rank_names, index_path, load_name_index
+
+
+def test_high_rank_names():
+    names = {
+        'John': {'rank': {'United Kingdom': 5000, 'United States': 3}},
+        'Zebedee': {'rank': {'United Kingdom': 5000}},
+    }
+    assert list(_high_rank_names(names, 1000)) == ['John']
+
+
+def test_load_name_index_reads_existing_index(tmp_path):
+    index_path(cache_dir=tmp_path).write_text('Dom\nJohn', encoding='utf-8')
+    assert load_name_index(cache_dir=tmp_path) == ['Dom', 'John']
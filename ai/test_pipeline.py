@@ -0,0 +1,39 @@
+from pipeline import (
+    find_conversation_ids,
+    iter_conversation_chunks,
+    iter_new_message_chunks,
+)
+
+DATASET = """ConvID,createdAt,body_clean,customer.id,createdBy.id
+1,2023-07-30T10:00:00.000Z,First message,10,100
+2,2023-08-01T10:00:00.000Z,Second message,20,200
+1,2023-08-02T10:00:00.000Z,Third message,10,100
+3,2023-08-03T10:00:00.000Z,Fourth message,30,300
+"""
+
+
+def test_find_conversation_ids(tmp_path):
+    path = tmp_path / "dataset.csv"
+    path.write_text(DATASET)
+    assert find_conversation_ids(path, "2023-08", chunksize=2) == [2, 1, 3]
+    assert find_conversation_ids(path, "2023-08", limit=2, chunksize=2) == [2, 1]
+
+
+def test_iter_conversation_chunks(tmp_path):
+    path = tmp_path / "dataset.csv"
+    path.write_text(DATASET)
+    chunks = list(iter_conversation_chunks(path, [1], chunksize=2))
+    assert [list(chunk["body_clean"]) for chunk in chunks] == [
+        ["First message"],
+        ["Third message"],
+    ]
+
+
+def test_iter_new_message_chunks(tmp_path):
+    path = tmp_path / "dataset.csv"
+    path.write_text(DATASET)
+    watermarks = {"1": "2023-07-30T10:00:00.000Z", "2": "2023-08-01T10:00:00.000Z"}
+    chunks = list(iter_new_message_chunks(path, watermarks, chunksize=10))
+    assert [list(chunk["body_clean"]) for chunk in chunks] == [
+        ["Third message", "Fourth message"]
+    ]
@@ -0,0 +1,17 @@
+from state import ConversationState
+
+
+def test_conversation_state(tmp_path):
+    state = ConversationState(tmp_path / "state.db")
+    assert state.watermarks() == {}
+    assert state.summary(1) is None
+
+    state.update(1, "2023-08-01T10:00:00.000Z", "First summary")
+    state.update(1, "2023-08-02T10:00:00.000Z", "Second summary")
+    assert state.watermarks() == {"1": "2023-08-02T10:00:00.000Z"}
+    assert state.summary(1) == "Second summary"
+
+
+def test_conversation_state_persists(tmp_path):
+    ConversationState(tmp_path / "state.db").update(1, "2023-08-01", "Summary")
+    assert ConversationState(tmp_path / "state.db").summary(1) == "Summary"
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from fake_llm import FakeLLM
+from state import ConversationState
+from summarise import EMAIL_SEPARATOR, map_template, pack, reduce_template, summarise, update_summaries
+
+
+def make_emails(count, words=50):
+    return [
+        {
+            "createdAt": "2023-08-{:02d}T00:00:00.000Z".format(i % 28 + 1),
+            "customer.id": i,
+            "body_clean": " ".join(["word"] * words),
+        }
+        for i in range(count)
+    ]
+
+
+def test_pack_respects_budget():
+    texts = ["a b", "c d e", "f", "g h i j k"]
+    assert pack(texts, 4, lambda text: len(text.split())) == [
+        ["a b"],
+        ["c d e", "f"],
+        ["g h i j k"],
+    ]
+
+
+def test_summarise_fits_in_one_call():
+    llm = FakeLLM()
+    asyncio.run(summarise(make_emails(3), llm, max_tokens=1000))
+    assert len(llm.calls) == 1
+
+
+def test_summarise_map_reduce():
+    llm = FakeLLM(latency=0.01)
+    summary = asyncio.run(summarise(make_emails(40), llm, max_tokens=300, concurrency=3))
+
+    template_tokens = max(
+        llm.get_num_tokens(map_template), llm.get_num_tokens(reduce_template)
+    )
+    assert all(call.tokens <= 300 + template_tokens for call in llm.calls)
+    assert llm.max_in_flight == 3
+    # The last call combines the partial summaries into the one returned
+    assert summary == "Summary {} of {} tokens".format(
+        len(llm.calls) - 1, llm.calls[-1].tokens
+    )
+    assert "several summaries" in llm.calls[-1].prompt
+
+
+def test_summarise_passes_lone_summaries_through():
+    llm = FakeLLM()
+    # An email per chunk, and only two of the three partial summaries fit a reduce
+    # prompt, so the third waits for the next round instead of being summarised alone
+    summary = asyncio.run(summarise(make_emails(3), llm, max_tokens=12))
+
+    reduce_calls = [call for call in llm.calls if "several summaries" in call.prompt]
+    assert len(reduce_calls) == 2
+    assert all(EMAIL_SEPARATOR in call.prompt for call in reduce_calls)
+    assert summary == "Summary 4 of {} tokens".format(llm.calls[-1].tokens)
+
+
+def test_summarise_without_emails():
+    with pytest.raises(ValueError):
+        asyncio.run(summarise([], FakeLLM()))
+
+
+def test_update_summaries(tmp_path):
+    state = ConversationState(tmp_path / "state.db")
+    state.update(1, "2023-07-31T00:00:00.000Z", "Earlier summary")
+    emails = [dict(email, ConvID=i % 2) for i, email in enumerate(make_emails(4))]
+    llm = FakeLLM()
+
+    updated = asyncio.run(update_summaries(emails, state, llm, max_tokens=1000))
+
+    assert sorted(updated) == [0, 1]
+    assert state.watermarks() == {
+        "0": "2023-08-03T00:00:00.000Z",
+        "1": "2023-08-04T00:00:00.000Z",
+    }
+    # The new emails of conversation 1 are combined with its earlier summary
+    assert any("Earlier summary" in call.prompt for call in llm.calls)
+    assert len(llm.calls) == 3
@@ -1,4 +1,16 @@
-from utils import scrub_email_addresses, scrub_names
+from pathlib import Path
+
+import pandas as pd
+
+import utils
+from utils import (
+    _scrub_names_names_dataset,
+    scrub_email_addresses,
+    scrub_email_addresses_series,
+    scrub_names,
+    scrub_names_many,
+    scrub_names_series,
+)
 
 
 def test_scrub_email():
@@ -36,3 +48,57 @@ def test_scrub_names():
 
     """
     )
+
+
+def test_scrub_names_many_keeps_order():
+    texts = ["Thanks Dom", "No names here", "Best, John"]
+    assert scrub_names_many(texts, batch_size=2) == [scrub_names(text) for text in texts]
+
+
+def test_series_scrubbers_match_per_row_scrubbers():
+    bodies = pd.Series(
+        ["Hi Dom, mail me at adam@example.com", "", None, "Best,\n\nJohn"],
+        index=[3, 1, 2, 0],
+    )
+    emails = bodies.dropna()
+    assert scrub_email_addresses_series(emails).equals(emails.map(scrub_email_addresses))
+    assert scrub_names_series(bodies).equals(
+        bodies.fillna("").map(_scrub_names_names_dataset)
+    )
+
+
+def test_scrub_cache_key_looks_up_the_index_once(monkeypatch):
+    calls = []
+
+    def index_path():
+        calls.append(None)
+        return Path("names-1.0-rank1000.txt")
+
+    monkeypatch.setattr(utils, "index_path", index_path)
+    utils._scrub_cache_config.cache_clear()
+    try:
+        assert utils._scrub_cache_key("Hi Dom") != utils._scrub_cache_key("Hi John")
+        assert utils._scrub_cache_key("Hi Dom") == utils._scrub_cache_key("Hi Dom")
+        assert len(calls) == 1
+    finally:
+        utils._scrub_cache_config.cache_clear()
+
+
+def test_scrub_names_series_matches_per_row_on_multi_word_names(monkeypatch):
+    matcher = utils.NameMatcher(["Mary", "Mary Ann", "Ann", "O'Neil", "Jean", "Jean-Luc"])
+    monkeypatch.setattr(utils, "_name_matcher", matcher)
+    bodies = pd.Series(
+        [
+            "Hi Mary Ann,",
+            "Thanks O'Neil",
+            "Jean-Luc and Jean",
+            "Mary Anne, Maryann and Ann-Marie",
+            "O'Neill",
+            None,
+        ]
+    )
+    scrubbed = scrub_names_series(bodies)
+    assert scrubbed.equals(bodies.fillna("").map(_scrub_names_names_dataset))
+    assert scrubbed[0] == "Hi <name>,"
+    assert scrubbed[1] == "Thanks <name>"
+    assert scrubbed[2] == "<name> and <name>"
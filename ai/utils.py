@@ -1,29 +1,203 @@
+import functools
 import re
 
-import spacy
-from names_dataset import NameDataset
+from cache import hash_key
+from name_index import index_path, load_name_index
 
-# The library takes time to initialize because the database is massive. A tip is to include its initialization in your app's startup process.
-nd = NameDataset()
-first_names = list(nd.first_names)
-last_names = list(nd.last_names)
+SPACY_MODEL = 'en_core_web_lg'
+# Only the entity recogniser is used, so skip the components that feed the tagger,
+# parser and lemmatizer
+SPACY_DISABLED_COMPONENTS = ['tagger', 'parser', 'attribute_ruler', 'lemmatizer']
 
-high_rank_first_names = []
-for name, name_data in nd.first_names.items():
-    for country, rank in name_data['rank'].items():
-        if rank < 1000:
-            high_rank_first_names.append(name)
-            break
+# Bump this whenever a change to the scrubbers changes their output, so cached results
+# from the old version are no longer used
+SCRUBBER_VERSION = 1
+
+EMAIL_PATTERN = r'[\w\.-]+@[\w\.-]+'
+# The same matches, since an address can only start where a run of the characters it's
+# made of starts. Saying so up front saves python's regex engine from retrying the match
+# at every character inside each word, but Arrow's engine doesn't support lookbehinds
+_ANCHORED_EMAIL_PATTERN = r'(?<![\w\.-])' + EMAIL_PATTERN
+
+_WORD_RE = re.compile(r'\w+')
+_WORD_CHAR_RE = re.compile(r'\w')
+
+
+def _trie_pattern(trie):
+    # '' marks the end of a name, which makes everything after it optional
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in trie.items() if char]
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else '(?:{})'.format('|'.join(branches))
+    if '' in trie:
+        return '(?:{})?'.format(body)
+    return body
+
+
+class NameMatcher:
+    """
+    Replace every name from a list in a single pass over a string.
+
+    Names are indexed by their first word, so each word of the input is looked up once
+    and only the names starting with that word are compared against the text. A match
+    has to start and end on a word boundary, as `re.sub(r'\\b{}\\b')` would, and the
+    longest matching name wins.
+    """
+
+    def __init__(self, names):
+        self._index = {}
+        for name in set(names):
+            first_word = _WORD_RE.match(name)
+            if first_word is None:
+                continue
+            self._index.setdefault(first_word.group(), []).append(name)
+        for candidates in self._index.values():
+            candidates.sort(key=len, reverse=True)
+        self._pattern = None
+
+    @property
+    def pattern(self):
+        """
+        A compiled regex matching the same names as `sub`, for `Series.str.replace`.
+
+        The names are merged into a trie, so the regex branches one character at a time
+        rather than trying every name in turn. Longer names are tried first and shorter
+        ones are fallen back on if the longer one doesn't end on a word boundary.
+        """
+        if self._pattern is None:
+            trie = {}
+            for candidates in self._index.values():
+                for name in candidates:
+                    node = trie
+                    for char in name:
+                        node = node.setdefault(char, {})
+                    node[''] = {}
+            body = _trie_pattern(trie) if trie else '(?!)'
+            self._pattern = re.compile(r'(?<!\w)' + body + r'\b')
+        return self._pattern
+
+    def _ends_on_boundary(self, string, end):
+        left = _WORD_CHAR_RE.match(string, end - 1) is not None
+        right = end < len(string) and _WORD_CHAR_RE.match(string, end) is not None
+        return left != right
+
+    def sub(self, replacement, string):
+        parts = []
+        position = 0
+        for word in _WORD_RE.finditer(string):
+            start = word.start()
+            if start < position:
+                continue
+            for name in self._index.get(word.group(), ()):
+                end = start + len(name)
+                if string.startswith(name, start) and self._ends_on_boundary(string, end):
+                    parts.append(string[position:start])
+                    parts.append(replacement)
+                    position = end
+                    break
+        parts.append(string[position:])
+        return ''.join(parts)
+
+
+_nlp = None
+_name_matcher = None
+_scrub_cache = None
+
+
+def _get_nlp():
+    global _nlp
+    if _nlp is None:
+        import spacy
+
+        _nlp = spacy.load(SPACY_MODEL, disable=SPACY_DISABLED_COMPONENTS)
+    return _nlp
+
+
+def _get_name_matcher():
+    global _name_matcher
+    if _name_matcher is None:
+        _name_matcher = NameMatcher(load_name_index())
+    return _name_matcher
+
+
+def load_scrubbers():
+    """
+    Load the name index and the spacy model up front, e.g. when a worker process starts,
+    rather than on the first string scrubbed.
+    """
+    _get_name_matcher()
+    _get_nlp()
+
+
+def use_scrub_cache(cache):
+    """
+    Look strings up in `cache`, a `cache.DiskCache`, before scrubbing their names and
+    store the results there afterwards. Pass None to stop caching.
+    """
+    global _scrub_cache
+    _scrub_cache = cache
+
+
+@functools.lru_cache(maxsize=None)
+def _scrub_cache_config():
+    # Looking up the names-dataset version behind index_path() is slower than scrubbing
+    # a short string, so the configuration is only worked out once
+    return (
+        SCRUBBER_VERSION,
+        SPACY_MODEL,
+        ','.join(SPACY_DISABLED_COMPONENTS),
+        index_path().name,
+    )
+
+
+def _scrub_cache_key(string):
+    return hash_key(*_scrub_cache_config(), string)
+
+
+def _get_cached(string):
+    if _scrub_cache is None:
+        return None
+    return _scrub_cache.get(_scrub_cache_key(string))
+
+
+def _set_cached(string, scrubbed):
+    if _scrub_cache is not None:
+        _scrub_cache.set(_scrub_cache_key(string), scrubbed)
 
-high_rank_last_names = []
-for name, name_data in nd.last_names.items():
-    for country, rank in name_data['rank'].items():
-        if rank < 1000:
-            high_rank_last_names.append(name)
-            break
 
 def scrub_email_addresses(string):
-    return re.sub(r'[\w\.-]+@[\w\.-]+', '<email>', string)
+    return re.sub(_ANCHORED_EMAIL_PATTERN, '<email>', string)
+
+
+def _is_arrow(series):
+    # Both pandas' own string dtype backed by pyarrow and pd.ArrowDtype
+    storage = getattr(series.dtype, 'storage', None)
+    return storage in ('pyarrow', 'pyarrow_numpy') or 'pyarrow' in str(series.dtype)
+
+
+def scrub_email_addresses_series(series):
+    """
+    Scrub email addresses from a whole pandas `Series` of strings at once.
+
+    Only the strings with an @ in them go through the regex. On a `string[pyarrow]`
+    series the replacement runs in Arrow, whose regex engine only treats ASCII letters
+    and digits as word characters.
+    """
+    pattern = EMAIL_PATTERN if _is_arrow(series) else _ANCHORED_EMAIL_PATTERN
+    has_at = series.str.contains('@', regex=False, na=False)
+    scrubbed = series.copy()
+    scrubbed[has_at] = series[has_at].str.replace(pattern, '<email>', regex=True)
+    return scrubbed
+
+
+def scrub_names_series(series):
+    """
+    Replace the names from the name index in a whole pandas `Series` of strings at once,
+    without the spacy pass, giving the same result as `_scrub_names_names_dataset` on
+    each row.
+    """
+    return series.fillna('').str.replace(_get_name_matcher().pattern, '<name>', regex=True)
+
 
 def _scrub_names_spacy(string):
     """
@@ -53,8 +227,10 @@ def _scrub_names_spacy(string):
 
     Don't use spacy, just use the lists of names
     """
-    nlp = spacy.load("en_core_web_lg")
-    doc = nlp(string)
+    return _replace_person_entities(string, _get_nlp()(string))
+
+
+def _replace_person_entities(string, doc):
     for ent in doc.ents:
         if ent.label_ == 'PERSON':
             string = string.replace(ent.text, '<name>')
@@ -62,15 +238,36 @@ def _scrub_names_spacy(string):
 
 
 def _scrub_names_names_dataset(string):
-    for name in high_rank_first_names:
-        if name in string:
-            string = re.sub(r'\b{}\b'.format(name), '<name>', string)
-    for name in high_rank_last_names:
-        if name in string:
-            string = re.sub(r'\b{}\b'.format(name), '<name>', string)
-    return string
+    return _get_name_matcher().sub('<name>', string)
 
 def scrub_names(string):
-    string = _scrub_names_spacy(string)
-    string = _scrub_names_names_dataset(string)
-    return string
\ No newline at end of file
+    cached = _get_cached(string)
+    if cached is not None:
+        return cached
+    scrubbed = _scrub_names_spacy(string)
+    scrubbed = _scrub_names_names_dataset(scrubbed)
+    _set_cached(string, scrubbed)
+    return scrubbed
+
+
+def scrub_names_many(texts, batch_size=64, n_process=1):
+    """
+    Scrub names from many strings at once, streaming them through spacy in batches.
+
+    Results are returned in the same order as `texts`. With `n_process` above 1, spacy
+    spreads the batches over that many processes.
+    """
+    texts = list(texts)
+    scrubbed = [_get_cached(text) for text in texts]
+    # Only the strings missing from the cache go through spacy, tagged with their
+    # position so the results can be put back in order
+    docs = _get_nlp().pipe(
+        ((text, i) for i, text in enumerate(texts) if scrubbed[i] is None),
+        as_tuples=True,
+        batch_size=batch_size,
+        n_process=n_process,
+    )
+    for doc, i in docs:
+        scrubbed[i] = _scrub_names_names_dataset(_replace_person_entities(texts[i], doc))
+        _set_cached(texts[i], scrubbed[i])
+    return scrubbed
@@ -0,0 +1,160 @@
+"""
+A local stand-in for GitHub's GraphQL API, for tests and offline runs.
+
+It answers the pull request queries of `generate_visualisation.py` from recorded pull
+request nodes, and keeps a rate limit the same way GitHub does.
+"""
+import asyncio
+import datetime
+import threading
+import time
+
+from aiohttp import web
+
+
+def _updated_key(node):
+    return node['updatedAt'], node['number']
+
+
+def _updated_cursor(node):
+    return '{}|{}'.format(*_updated_key(node))
+
+
+class FakeGraphQL:
+    """
+    Serve pages of `pull_requests`, a dict of "owner/name" to the recorded pull request
+    nodes of that repository in the order they were created, `page_size` at a time.
+
+    Pages going back from a `before` cursor are cut by position, while pages ordered by
+    `updatedAt` use the last `updatedAt` and number seen as their cursor, as GitHub's
+    cursors carry the value they're sorted on and a tie breaker.
+
+    Each request costs a credit out of `limit`, which comes back `reset_seconds` after
+    the first request of the period. Once there are none left, requests are answered
+    with a 403 and the X-RateLimit headers, as GitHub does. Responses queued with
+    `fail_next` are sent before anything else, to simulate secondary rate limits and
+    other errors. Every request's variables are recorded in `requests`, and the answers
+    in `statuses`.
+    """
+
+    def __init__(self, pull_requests, page_size=100, limit=5000, reset_seconds=3600):
+        self.pull_requests = pull_requests
+        self.page_size = page_size
+        self.limit = limit
+        self.reset_seconds = reset_seconds
+        self.remaining = limit
+        self.reset_at = None
+        self.requests = []
+        self.statuses = []
+        self._failures = []
+        self._loop = None
+        self._runner = None
+        self.url = None
+
+    def fail_next(self, status, headers=None, message='Something went wrong'):
+        self._failures.append((status, headers or {}, message))
+
+    def _page(self, nodes, variables):
+        if 'after' in variables:
+            nodes = sorted(nodes, key=_updated_key)
+            after = variables['after']
+            if after is not None:
+                updated_at, number = after.rsplit('|', 1)
+                nodes = [node for node in nodes if _updated_key(node) > (updated_at, int(number))]
+            page = nodes[: self.page_size]
+            return {
+                'pageInfo': {
+                    'startCursor': _updated_cursor(page[0]) if page else None,
+                    'hasPreviousPage': after is not None,
+                    'hasNextPage': len(nodes) > self.page_size,
+                    'endCursor': _updated_cursor(page[-1]) if page else None,
+                },
+                'nodes': page,
+            }
+        end = len(nodes) if variables.get('before') is None else int(variables['before'])
+        start = max(end - self.page_size, 0)
+        return {
+            'pageInfo': {
+                'startCursor': str(start),
+                'hasPreviousPage': start > 0,
+                'hasNextPage': end < len(nodes),
+                'endCursor': str(end),
+            },
+            'nodes': nodes[start:end],
+        }
+
+    def _respond(self, status, body, headers=None):
+        self.statuses.append(status)
+        return web.json_response(body, status=status, headers=headers)
+
+    async def _handle(self, request):
+        variables = (await request.json())['variables']
+        self.requests.append(variables)
+
+        if self._failures:
+            status, headers, message = self._failures.pop(0)
+            return self._respond(status, {'message': message}, headers)
+
+        now = time.time()
+        if self.reset_at is None or now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.reset_seconds
+        if self.remaining == 0:
+            return self._respond(
+                403,
+                {'message': 'API rate limit exceeded'},
+                {
+                    'X-RateLimit-Remaining': '0',
+                    'X-RateLimit-Reset': str(int(self.reset_at) + 1),
+                },
+            )
+        self.remaining -= 1
+
+        repository = '{}/{}'.format(variables['owner'], variables['name'])
+        if repository not in self.pull_requests:
+            return self._respond(
+                200,
+                {'errors': [{'message': f"Could not resolve to a Repository {repository}"}]},
+            )
+        reset_at = datetime.datetime.fromtimestamp(self.reset_at, datetime.timezone.utc)
+        return self._respond(
+            200,
+            {
+                'data': {
+                    'repository': {
+                        'pullRequests': self._page(self.pull_requests[repository], variables)
+                    },
+                    'rateLimit': {
+                        'limit': self.limit,
+                        'cost': 1,
+                        'remaining': self.remaining,
+                        'resetAt': reset_at.isoformat().replace('+00:00', 'Z'),
+                    },
+                }
+            },
+        )
+
+    def start(self):
+        """Serve on a free local port from a thread of its own, and return the url."""
+        self._loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_post('/graphql', self._handle)
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        self._loop.run_until_complete(site.start())
+        port = self._runner.addresses[0][1]
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{port}/graphql'
+        return self.url
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
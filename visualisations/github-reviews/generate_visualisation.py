@@ -1,123 +1,324 @@
+import asyncio
+import datetime
 import json
+import os
 import sqlite3
-import subprocess
+import time
+from collections import Counter, deque
 
+import aiohttp
 import click
-import requests
-from itsdangerous import json
 from tqdm import tqdm
 
-# read string from file
-with open('token.pwd') as f:
-    api_token = f.read().strip()
-
-url = 'https://api.github.com/graphql'
-query = '''
-query ($owner: String!, $name: String!, $before: String) {
-    repository(name: $name, owner: $owner) {
-        pullRequests(last:100, before: $before) {
-            pageInfo {
-                startCursor
-                hasNextPage
-                endCursor
-            }
+# Point this at another server, e.g. a local one replaying recorded pages, with --url
+url = os.environ.get('GITHUB_GRAPHQL_URL', 'https://api.github.com/graphql')
+# Number of repositories fetched at once
+CONCURRENCY = 4
+# Times a request is retried when GitHub asks us to slow down
+MAX_RETRIES = 5
+# Longest wait between retries without a Retry-After header, in seconds
+MAX_BACKOFF = 60
+# Database the reviews are loaded into, and the graph is read from
+DB_PATH = 'github.db'
+# Reviews inserted per transaction when loading the database from scratch
+BATCH_SIZE = 10_000
+
+pull_request_fields = '''
+    pageInfo {
+        startCursor
+        hasPreviousPage
+        hasNextPage
+        endCursor
+    }
+    nodes {
+        author {
+            login
+        }
+        number
+        createdAt
+        updatedAt
+        state
+        reviews(last:10, , states: [APPROVED, CHANGES_REQUESTED]) {
             nodes {
                 author {
                     login
                 }
-                number
-                createdAt
+                publishedAt
                 state
-                reviews(last:10, , states: [APPROVED, CHANGES_REQUESTED]) {
-                    nodes {
-                        author {
-                            login
-                        }
-                        publishedAt
-                        state
-                    }
-                }
             }
         }
     }
+'''
+rate_limit_fields = '''
     rateLimit {
         limit
         cost
         remaining
         resetAt
     }
-}
 '''
-headers = {'Authorization': 'token %s' % api_token}
+query = '''
+query ($owner: String!, $name: String!, $before: String) {
+    repository(name: $name, owner: $owner) {
+        pullRequests(last:100, before: $before) {%s}
+    }%s
+}
+''' % (pull_request_fields, rate_limit_fields)
+# Pull requests in the order they were last updated, to carry on from a stored cursor
+updated_query = '''
+query ($owner: String!, $name: String!, $after: String) {
+    repository(name: $name, owner: $owner) {
+        pullRequests(first:100, after: $after, orderBy: {field: UPDATED_AT, direction: ASC}) {%s}
+    }%s
+}
+''' % (pull_request_fields, rate_limit_fields)
+
+
+def get_headers():
+    # read string from file
+    with open('token.pwd') as f:
+        api_token = f.read().strip()
+    return {'Authorization': 'token %s' % api_token}
 
 
 @click.command()
-@click.option('--owner', prompt='Your Repository Owner')
-@click.option('--name', prompt='Your Repository Name')
+@click.option('--owner', help='Owner of the repository, prompted for if no --repo is given')
+@click.option('--name', help='Name of the repository, prompted for if no --repo is given')
+@click.option(
+    '--repo',
+    'repos',
+    multiple=True,
+    help='Repository to pull as OWNER/NAME, can be given more than once',
+)
 @click.option('--limit', default=100, help='Number of pull requests to pull')
-def run(owner, name, limit):
+@click.option('--url', default=url, help='GitHub GraphQL endpoint')
+@click.option(
+    '--incremental',
+    is_flag=True,
+    help='Only pull the pull requests updated since the last incremental run',
+)
+@click.option(
+    '--min-reviews',
+    default=5,
+    help='Only show reviewers who approved more than this many pull requests of an author',
+)
+@click.option(
+    '--window',
+    type=click.Choice(['week', 'month', 'quarter']),
+    help='Also make a graph per window of time, to scrub through in the frontend',
+)
+@click.option('--span', default=1, help='Number of weeks, months or quarters in each window')
+def run(owner, name, repos, limit, url, incremental, min_reviews, window, span):
     """Simple program that greets NAME for a total of COUNT times."""
 
+    repos = [tuple(repo.split('/', 1)) for repo in repos]
+    if owner or name or not repos:
+        owner = owner or click.prompt('Your Repository Owner')
+        name = name or click.prompt('Your Repository Name')
+        repos.append((owner, name))
+
     ctx = click.get_current_context()
-    ctx.meta['OWNER'] = owner
-    ctx.meta['NAME'] = name
+    ctx.meta['REPOS'] = repos
     ctx.meta['LIMIT'] = limit // 100
     ctx.meta['BEFORE'] = None
-
-    pull_data()
-    generate_db()
+    ctx.meta['URL'] = url
+    ctx.meta['MIN_REVIEWS'] = min_reviews
+    ctx.meta['WINDOW'] = window
+    ctx.meta['SPAN'] = span
+
+    if incremental:
+        sync_data()
+    else:
+        generate_db()
     converting_to_cytoscape()
+    converting_to_cytoscape_windows()
     display_graph()
 
 
-def pull_data():
-
-    with open('output.jsonl', 'w') as outfile:
-        for entry in paginate_reverse():
-            json.dump(entry, outfile)
-            outfile.write('\n')
+class RateLimit:
+    """
+    Keep track of the GraphQL rate limit shared by every request, from the `rateLimit`
+    of each response, and hold requests back until it resets once there aren't enough
+    points left for another page.
+    """
 
+    def __init__(self):
+        self.remaining = None
+        self.cost = 1
+        self.reset_at = None
 
-def paginate_reverse():
+    def update(self, rate_limit):
+        self.remaining = rate_limit['remaining']
+        self.cost = max(rate_limit['cost'], 1)
+        self.reset_at = datetime.datetime.fromisoformat(
+            rate_limit['resetAt'].replace('Z', '+00:00')
+        )
 
-    ctx = click.get_current_context()
-    owner = ctx.meta['OWNER']
-    name = ctx.meta['NAME']
-    before = ctx.meta['BEFORE']
-    limit = ctx.meta['LIMIT']
+    async def wait(self):
+        if self.remaining is None or self.remaining >= self.cost:
+            return
+        now = datetime.datetime.now(datetime.timezone.utc)
+        delay = max((self.reset_at - now).total_seconds(), 0)
+        print(f"⏳ - Out of credits, waiting {delay:.0f}s for them to reset")
+        await asyncio.sleep(delay)
+        self.remaining = None
+
+    def spend(self):
+        # Count the page as paid for before the response arrives, so requests sent
+        # at the same time don't all think the last credits are theirs
+        if self.remaining is not None:
+            self.remaining -= self.cost
+
+
+async def get_retry_delay(response, attempt):
+    """
+    Work out how long to wait before retrying a request GitHub rate limited, or return
+    None if the response isn't a rate limit, e.g. a 403 for a bad token, and retrying
+    won't help.
+    """
+    if response.status not in (403, 429):
+        return None
+    retry_after = response.headers.get('Retry-After')
+    if retry_after:
+        return float(retry_after)
+    # Out of credits for the hour, which resets at the given epoch time
+    reset = response.headers.get('X-RateLimit-Reset')
+    if response.headers.get('X-RateLimit-Remaining') == '0' and reset:
+        return max(float(reset) - time.time(), 0)
+    # Secondary rate limits don't always come with a Retry-After, but say so in the body
+    if response.status == 429 or 'rate limit' in (await response.text()).lower():
+        return min(2**attempt, MAX_BACKOFF)
+    return None
+
+
+async def post_query(session, rate_limit, url, query, variables):
+    for attempt in range(MAX_RETRIES + 1):
+        await rate_limit.wait()
+        rate_limit.spend()
+        async with session.post(
+            url, json={'query': query, 'variables': variables}
+        ) as response:
+            delay = await get_retry_delay(response, attempt)
+            if delay is not None and attempt < MAX_RETRIES:
+                print(f"⏳ - Rate limited, retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                continue
+            response.raise_for_status()
+            payload = await response.json()
+        if 'data' in payload and payload['data'].get('rateLimit'):
+            rate_limit.update(payload['data']['rateLimit'])
+        return payload
+
+
+async def fetch_repository(session, rate_limit, url, query, repository, limit, cursor, forwards, queue, progress):
+    owner, name = repository.split('/', 1)
+    direction = 'after' if forwards else 'before'
     variables = {
         'owner': owner,
         'name': name,
-        'before': before,
+        direction: cursor,
     }
 
     print(f"ℹ️  - Requesting Data | owner: {owner} | name: {name}")
 
-    for _ in tqdm(range(limit)):
-        payload = requests.post(
-            url, json={'query': query, 'variables': variables}, headers=headers
-        ).json()
+    for _ in range(limit):
+        payload = await post_query(session, rate_limit, url, query, variables)
+        progress.update()
         if 'errors' in payload:
             for error in payload['errors']:
                 print(f'❌ - Errors found in payload: {error["message"]}')
             return
-        remaining_credits = payload['data']['rateLimit']['remaining']
-        start_cursor = payload['data']['repository']['pullRequests']['pageInfo'][
-            'startCursor'
-        ]
+        await queue.put((repository, payload))
+        page_info = payload['data']['repository']['pullRequests']['pageInfo']
+        if forwards and not page_info['hasNextPage']:
+            return
+        if not forwards and not page_info['hasPreviousPage']:
+            return
         variables.update(
             {
-                'before': start_cursor,
+                direction: page_info['endCursor' if forwards else 'startCursor'],
             }
         )
-        if remaining_credits == 0:
-            break
-        yield from get_pull_requests(payload)
+
+
+async def fetch_all(url, query, cursors, limit, forwards, queue):
+    rate_limit = RateLimit()
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def fetch(repository, cursor):
+        async with semaphore:
+            await fetch_repository(
+                session, rate_limit, url, query, repository, limit, cursor, forwards, queue, progress
+            )
+
+    connector = aiohttp.TCPConnector(limit=CONCURRENCY)
+    with tqdm(total=limit * len(cursors)) as progress:
+        async with aiohttp.ClientSession(headers=get_headers(), connector=connector) as session:
+            await asyncio.gather(*(fetch(repo, cursor) for repo, cursor in cursors.items()))
+    return rate_limit.remaining
+
+
+def fetch_pages(query, cursors, forwards=False):
+    """
+    Fetch pages of pull requests of several repositories at a time, starting from the
+    cursor of each repository in `cursors`, and yield each as (repository, payload) as
+    soon as it arrives. Pages go back in time from the cursor, or forwards if `forwards`.
+    """
+
+    ctx = click.get_current_context()
+    limit = ctx.meta['LIMIT']
+    url = ctx.meta['URL']
+
+    # Drive the fetchers from this generator, running the event loop whenever it waits
+    # for the next page
+    loop = asyncio.new_event_loop()
+    queue = asyncio.Queue(maxsize=CONCURRENCY * 2)
+    done = object()
+
+    async def fetch():
+        try:
+            return await fetch_all(url, query, cursors, limit, forwards, queue)
+        finally:
+            await queue.put(done)
+
+    task = loop.create_task(fetch())
+    try:
+        while True:
+            page = loop.run_until_complete(queue.get())
+            if page is done:
+                break
+            yield page
+        remaining_credits = loop.run_until_complete(task)
+    finally:
+        if not task.done():
+            # Make room for the fetcher to signal it's done once it's been cancelled
+            while not queue.empty():
+                queue.get_nowait()
+            task.cancel()
+            try:
+                loop.run_until_complete(task)
+            except asyncio.CancelledError:
+                pass
+        loop.close()
 
     print(f"ℹ️  - You have {remaining_credits} credits left")
     print('✅ - Data generated')
 
 
+def paginate_reverse():
+    """
+    Fetch the pull requests of every repository, newest first and several repositories
+    at a time, yielding a record per review as soon as its page arrives.
+    """
+
+    ctx = click.get_current_context()
+    cursors = {f'{owner}/{name}': ctx.meta['BEFORE'] for owner, name in ctx.meta['REPOS']}
+
+    for repository, payload in fetch_pages(query, cursors):
+        for entry in get_pull_requests(payload):
+            yield {'repository': repository, **entry}
+
+
 def get_reviews(pull_request):
     for review in pull_request['reviews']['nodes']:
         try:
@@ -133,45 +334,360 @@ def get_reviews(pull_request):
         }
 
 
+def get_pull_request(pull_request):
+    try:
+        pr_author = pull_request['author']['login']
+    except TypeError:
+        pr_author = None
+    except KeyError:
+        pr_author = None
+    return {
+        'pr_author': pr_author,
+        'pr_number': pull_request['number'],
+        'pr_created_at': pull_request['createdAt'],
+        'pr_updated_at': pull_request['updatedAt'],
+        'pr_state': pull_request['state'],
+    }
+
+
 def get_pull_requests(payload):
     for pull_request in payload['data']['repository']['pullRequests']['nodes']:
-        pr_number = pull_request['number']
-        try:
-            pr_author = pull_request['author']['login']
-        except TypeError:
-            pr_author = None
-        except KeyError:
-            pr_author = None
-        pr_created_at = pull_request['createdAt']
-        pr_state = pull_request['state']
+        pr = get_pull_request(pull_request)
         for review in get_reviews(pull_request):
             yield {
-                'pr_author': pr_author,
-                'pr_number': pr_number,
-                'pr_created_at': pr_created_at,
-                'pr_state': pr_state,
+                **pr,
                 **review,
             }
 
 
-def generate_db():
+def connect():
+    conn = sqlite3.connect(DB_PATH)
+    # Readers don't block the loader, and syncing to disk on every commit isn't needed
+    # for a database that can always be pulled again
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute('PRAGMA cache_size = -64000')
+    return conn
+
+
+def create_tables(conn):
+    with conn:
+        conn.executescript(
+            '''
+        CREATE TABLE IF NOT EXISTS pull_requests (
+            id INTEGER PRIMARY KEY,
+            repository TEXT,
+            pr_author TEXT,
+            pr_number INTEGER,
+            pr_created_at TEXT,
+            pr_updated_at TEXT,
+            pr_state TEXT
+        );
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INTEGER PRIMARY KEY,
+            review_author TEXT,
+            review_published_at TEXT,
+            review_state TEXT,
+            pull_requests_id INTEGER REFERENCES pull_requests(id)
+        );
+        CREATE TABLE IF NOT EXISTS sync_state (
+            repository TEXT PRIMARY KEY,
+            cursor TEXT,
+            updated_at TEXT
+        );
+        '''
+        )
 
-    try:
-        subprocess.check_call(
-            'sqlite-utils insert github.db reviews output.jsonl --nl', shell=True
+
+def create_indexes(conn):
+    with conn:
+        conn.executescript(
+            '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_pull_requests_repository_pr_number
+            ON pull_requests (repository, pr_number);
+        CREATE INDEX IF NOT EXISTS idx_pull_requests_pr_author
+            ON pull_requests (pr_author);
+        CREATE INDEX IF NOT EXISTS idx_reviews_review_author
+            ON reviews (review_author);
+        CREATE INDEX IF NOT EXISTS idx_reviews_pull_requests_id
+            ON reviews (pull_requests_id);
+        CREATE INDEX IF NOT EXISTS idx_reviews_review_published_at
+            ON reviews (review_published_at);
+        '''
+        )
+
+
+def create_review_edges(conn):
+    """
+    Keep approvals, change requests and their total per reviewer, pull request author and
+    month in `review_edges`, up to date through triggers on `reviews`. Self reviews are
+    left out. The table is filled from the reviews already there when it's created.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'review_edges'"
+    ).fetchone()
+    with conn:
+        if not exists:
+            conn.executescript(
+                '''
+            CREATE TABLE review_edges (
+                review_author TEXT NOT NULL,
+                pr_author TEXT NOT NULL,
+                month TEXT NOT NULL,
+                approvals INTEGER NOT NULL,
+                change_requests INTEGER NOT NULL,
+                total INTEGER NOT NULL,
+                PRIMARY KEY (review_author, pr_author, month)
+            );
+            INSERT INTO review_edges
+            SELECT
+                review_author,
+                pr_author,
+                COALESCE(substr(review_published_at, 1, 7), ''),
+                SUM(review_state = 'APPROVED'),
+                SUM(review_state = 'CHANGES_REQUESTED'),
+                COUNT(*)
+            FROM
+                reviews AS r
+                    JOIN
+                pull_requests AS p
+            ON
+                p.id = r.pull_requests_id
+            WHERE
+                review_author <> pr_author
+                AND
+                review_state IN ('CHANGES_REQUESTED', 'APPROVED')
+            GROUP BY
+                1, 2, 3;
+            '''
+            )
+        conn.executescript(
+            '''
+        CREATE TRIGGER IF NOT EXISTS reviews_insert_review_edges AFTER INSERT ON reviews
+        BEGIN
+            INSERT INTO review_edges
+            SELECT
+                NEW.review_author,
+                p.pr_author,
+                COALESCE(substr(NEW.review_published_at, 1, 7), ''),
+                NEW.review_state = 'APPROVED',
+                NEW.review_state = 'CHANGES_REQUESTED',
+                1
+            FROM
+                pull_requests AS p
+            WHERE
+                p.id = NEW.pull_requests_id
+                AND
+                NEW.review_author <> p.pr_author
+                AND
+                NEW.review_state IN ('CHANGES_REQUESTED', 'APPROVED')
+            ON CONFLICT (review_author, pr_author, month) DO UPDATE SET
+                approvals = approvals + excluded.approvals,
+                change_requests = change_requests + excluded.change_requests,
+                total = total + 1;
+        END;
+        DROP TRIGGER IF EXISTS reviews_delete_review_edges;
+        CREATE TRIGGER reviews_delete_review_edges AFTER DELETE ON reviews
+        WHEN OLD.review_state IN ('CHANGES_REQUESTED', 'APPROVED')
+        BEGIN
+            UPDATE review_edges SET
+                approvals = approvals - (OLD.review_state = 'APPROVED'),
+                change_requests = change_requests - (OLD.review_state = 'CHANGES_REQUESTED'),
+                total = total - 1
+            WHERE
+                review_author = OLD.review_author
+                AND
+                pr_author = (SELECT pr_author FROM pull_requests WHERE id = OLD.pull_requests_id)
+                AND
+                month = COALESCE(substr(OLD.review_published_at, 1, 7), '');
+            DELETE FROM review_edges
+            WHERE
+                review_author = OLD.review_author
+                AND
+                pr_author = (SELECT pr_author FROM pull_requests WHERE id = OLD.pull_requests_id)
+                AND
+                month = COALESCE(substr(OLD.review_published_at, 1, 7), '')
+                AND
+                total = 0;
+        END;
+        '''
         )
-        subprocess.check_call(
-            'sqlite-utils extract github.db reviews pr_author pr_number pr_created_at pr_state --table pull_requests',
-            shell=True,
+
+
+def insert_batch(conn, pull_requests, reviews):
+    with conn:
+        conn.executemany(
+            '''
+        INSERT INTO pull_requests (id, repository, pr_author, pr_number, pr_created_at, pr_updated_at, pr_state)
+        VALUES (:id, :repository, :pr_author, :pr_number, :pr_created_at, :pr_updated_at, :pr_state)
+        ''',
+            pull_requests,
         )
-    except subprocess.CalledProcessError:
-        print('❌ - Error generating database')
-        return
+        conn.executemany(
+            '''
+        INSERT INTO reviews (review_author, review_published_at, review_state, pull_requests_id)
+        VALUES (:review_author, :review_published_at, :review_state, :pull_requests_id)
+        ''',
+            reviews,
+        )
+
+
+def generate_db():
+    """
+    Load the reviews from paginate_reverse into a fresh database as they arrive, with
+    the pull requests they belong to in a table of their own.
+    """
+
+    conn = connect()
+    with conn:
+        conn.executescript(
+            '''
+        DROP TABLE IF EXISTS review_edges;
+        DROP TABLE IF EXISTS reviews;
+        DROP TABLE IF EXISTS pull_requests;
+        DROP TABLE IF EXISTS sync_state;
+        '''
+        )
+    create_tables(conn)
+
+    pull_request_ids = {}
+    pull_requests = []
+    reviews = []
+    for entry in paginate_reverse():
+        key = (entry['repository'], entry['pr_number'])
+        if key not in pull_request_ids:
+            pull_request_ids[key] = len(pull_request_ids) + 1
+            pull_requests.append(
+                {
+                    'id': pull_request_ids[key],
+                    'repository': entry['repository'],
+                    'pr_author': entry['pr_author'],
+                    'pr_number': entry['pr_number'],
+                    'pr_created_at': entry['pr_created_at'],
+                    'pr_updated_at': entry['pr_updated_at'],
+                    'pr_state': entry['pr_state'],
+                }
+            )
+        reviews.append(
+            {
+                'review_author': entry['review_author'],
+                'review_published_at': entry['review_published_at'],
+                'review_state': entry['review_state'],
+                'pull_requests_id': pull_request_ids[key],
+            }
+        )
+        if len(reviews) >= BATCH_SIZE:
+            insert_batch(conn, pull_requests, reviews)
+            pull_requests = []
+            reviews = []
+    insert_batch(conn, pull_requests, reviews)
+
+    # Building the indexes and review edges once everything is in is quicker than
+    # keeping them up to date on every insert
+    create_indexes(conn)
+    create_review_edges(conn)
+    conn.close()
     print('✅ - Database generated')
 
 
-def get_reviews_from_db(json_str=False):
-    conn = sqlite3.connect('github.db')
+def upsert_pull_request(conn, repository, pull_request):
+    """Insert or update a pull request and replace its reviews."""
+    pr = get_pull_request(pull_request)
+    # Delete the old reviews first, so the review edges they're taken off are those of
+    # the pull request's author as it was stored
+    conn.execute(
+        '''
+    DELETE FROM reviews WHERE pull_requests_id IN (
+        SELECT id FROM pull_requests WHERE repository = ? AND pr_number = ?
+    )
+    ''',
+        (repository, pr['pr_number']),
+    )
+    conn.execute(
+        '''
+    INSERT INTO pull_requests (repository, pr_author, pr_number, pr_created_at, pr_updated_at, pr_state)
+    VALUES (:repository, :pr_author, :pr_number, :pr_created_at, :pr_updated_at, :pr_state)
+    ON CONFLICT (repository, pr_number) DO UPDATE SET
+        pr_author = excluded.pr_author,
+        pr_created_at = excluded.pr_created_at,
+        pr_updated_at = excluded.pr_updated_at,
+        pr_state = excluded.pr_state
+    ''',
+        {'repository': repository, **pr},
+    )
+    (pull_requests_id,) = conn.execute(
+        'SELECT id FROM pull_requests WHERE repository = ? AND pr_number = ?',
+        (repository, pr['pr_number']),
+    ).fetchone()
+    conn.executemany(
+        '''
+    INSERT INTO reviews (review_author, review_published_at, review_state, pull_requests_id)
+    VALUES (:review_author, :review_published_at, :review_state, :pull_requests_id)
+    ''',
+        [
+            {**review, 'pull_requests_id': pull_requests_id}
+            for review in get_reviews(pull_request)
+        ],
+    )
+
+
+def sync_data():
+    """
+    Bring the database up to date with the pull requests created or updated since the
+    last incremental run, carrying on from the cursor stored for each repository. The
+    first run of a repository goes through all of its pull requests, up to --limit.
+    """
+
+    ctx = click.get_current_context()
+    repositories = [f'{owner}/{name}' for owner, name in ctx.meta['REPOS']]
+
+    conn = connect()
+    create_tables(conn)
+    create_indexes(conn)
+    create_review_edges(conn)
+    state = {
+        repository: (cursor, updated_at)
+        for repository, cursor, updated_at in conn.execute(
+            'SELECT repository, cursor, updated_at FROM sync_state'
+        )
+    }
+    cursors = {repo: state.get(repo, (None, None))[0] for repo in repositories}
+    watermarks = {repo: state.get(repo, (None, None))[1] for repo in repositories}
+    since = dict(watermarks)
+
+    synced = 0
+    for repository, payload in fetch_pages(updated_query, cursors, forwards=True):
+        pull_requests = payload['data']['repository']['pullRequests']
+        with conn:
+            for pull_request in pull_requests['nodes']:
+                # Pull requests don't move back behind the cursor, but skip any that
+                # haven't changed since the last sync just in case. One updated in the
+                # same second as the last sync can still be new, and upserting it again
+                # does no harm
+                if since[repository] and pull_request['updatedAt'] < since[repository]:
+                    continue
+                upsert_pull_request(conn, repository, pull_request)
+                synced += 1
+            updated_at = max(
+                [watermarks[repository] or '']
+                + [pr['updatedAt'] for pr in pull_requests['nodes']]
+            )
+            watermarks[repository] = updated_at or None
+            # An empty page has no cursor, so keep the one we started from
+            cursor = pull_requests['pageInfo']['endCursor'] or cursors[repository]
+            cursors[repository] = cursor
+            conn.execute(
+                'INSERT OR REPLACE INTO sync_state (repository, cursor, updated_at) VALUES (?, ?, ?)',
+                (repository, cursor, watermarks[repository]),
+            )
+
+    conn.close()
+    print(f'✅ - Synced {synced} pull requests')
+
+
+def get_reviews_from_db(min_value, json_str=False):
+    conn = sqlite3.connect(DB_PATH)
     conn.row_factory = (
         sqlite3.Row
     )  # This enables column access by name: row['column_name']
@@ -182,24 +698,17 @@ def get_reviews_from_db(json_str=False):
     SELECT
         pr_author AS target,
         review_author AS source,
-        SUM(CASE WHEN review_state = "APPROVED" THEN 1 ELSE 0 END) AS value,
-        CAST(SUM(CASE WHEN review_state = "CHANGES_REQUESTED" THEN 1 ELSE 0 END) AS FLOAT) / COUNT(*) AS change_request_rate,
+        SUM(approvals) AS value,
+        CAST(SUM(change_requests) AS FLOAT) / SUM(total) AS change_request_rate,
         "licensing" AS type
     FROM
-        reviews AS r
-            LEFT JOIN
-        pull_requests AS p
-    ON
-        p.id = r.pull_requests_id
-    WHERE
-        review_author <> pr_author
-        AND
-        review_state IN ("CHANGES_REQUESTED", "APPROVED")
+        review_edges
     GROUP BY
         review_author, pr_author
     HAVING
-        value > 1
-    '''
+        value > ?
+    ''',
+        (min_value,),
     ).fetchall()
 
     conn.commit()
@@ -211,24 +720,126 @@ def get_reviews_from_db(json_str=False):
     return [dict(ix) for ix in rows]  # CREATE LIST
 
 
+def get_period(published_at, window):
+    # Number the week, starting on Mondays, month or quarter of a date
+    date = datetime.date.fromisoformat(published_at[:10])
+    if window == 'week':
+        return (date.toordinal() - 1) // 7
+    if window == 'month':
+        return date.year * 12 + date.month - 1
+    return date.year * 4 + (date.month - 1) // 3
+
+
+def get_period_start(period, window):
+    if window == 'week':
+        return datetime.date.fromordinal(period * 7 + 1)
+    if window == 'month':
+        return datetime.date(period // 12, period % 12 + 1, 1)
+    return datetime.date(period // 4, period % 4 * 3 + 1, 1)
+
+
+def get_review_windows(window, span, min_value):
+    """
+    Work out the connections of every window of `span` weeks, months or quarters, one
+    period apart, in a single pass over the reviews in the order they were published.
+
+    The counts of the periods in the current window are kept along with their running
+    total, so moving the window along adds the newest period and takes off the oldest
+    rather than counting the whole window again.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    rows = conn.execute(
+        '''
+    SELECT
+        review_author,
+        pr_author,
+        review_state,
+        review_published_at
+    FROM
+        reviews AS r
+            JOIN
+        pull_requests AS p
+    ON
+        p.id = r.pull_requests_id
+    WHERE
+        review_author <> pr_author
+        AND
+        review_state IN ("CHANGES_REQUESTED", "APPROVED")
+        AND
+        review_published_at IS NOT NULL
+    ORDER BY
+        review_published_at
+    '''
+    )
+
+    history = deque()
+    totals = Counter()
+    windows = []
+
+    def close(period, counts):
+        history.append(counts)
+        totals.update(counts)
+        if len(history) > span:
+            for key, count in history.popleft().items():
+                totals[key] -= count
+                if not totals[key]:
+                    del totals[key]
+        connections = []
+        for (source, target, state), value in totals.items():
+            if state != 'APPROVED' or value <= min_value:
+                continue
+            change_requests = totals[(source, target, 'CHANGES_REQUESTED')]
+            connections.append(
+                {
+                    'source': source,
+                    'target': target,
+                    'value': value,
+                    'change_request_rate': change_requests / (value + change_requests),
+                }
+            )
+        windows.append(
+            {
+                'start': get_period_start(period - len(history) + 1, window).isoformat(),
+                'end': get_period_start(period + 1, window).isoformat(),
+                'connections': connections,
+            }
+        )
+
+    current = None
+    counts = Counter()
+    for review_author, pr_author, review_state, review_published_at in rows:
+        period = get_period(review_published_at, window)
+        if current is None:
+            current = period
+        while current < period:
+            close(current, counts)
+            current += 1
+            counts = Counter()
+        counts[(review_author, pr_author, review_state)] += 1
+    if current is not None:
+        close(current, counts)
+
+    conn.close()
+    return windows
+
+
 def get_node_to_id_mapping(connections):
+    # Sorted so the same people keep the same ids between runs
     return {
         node_name: str(idx)
         for idx, node_name in enumerate(
-            set(x['source'] for x in connections).union(
-                set(x['target'] for x in connections)
+            sorted(
+                set(x['source'] for x in connections).union(
+                    set(x['target'] for x in connections)
+                )
             )
         )
     }
 
 
-def filter_connections(connections):
-    return [connection for connection in connections if connection["value"] > 5]
+def convert_cytoscape(connections, node_to_id_mapping=None):
 
-
-def convert_cytoscape(connections):
-
-    node_to_id_mapping = get_node_to_id_mapping(connections)
+    node_to_id_mapping = node_to_id_mapping or get_node_to_id_mapping(connections)
 
     return {
         "nodes": [
@@ -250,13 +861,51 @@ def convert_cytoscape(connections):
 
 def converting_to_cytoscape():
 
+    ctx = click.get_current_context()
     with open('connections.json', mode='w') as f:
-        connections = get_reviews_from_db()
-        connections = filter_connections(connections)
+        connections = get_reviews_from_db(ctx.meta['MIN_REVIEWS'])
         f.write(json.dumps(convert_cytoscape(connections)))
     print('✅ - Prepared connections from frontend')
 
 
+def converting_to_cytoscape_windows():
+
+    ctx = click.get_current_context()
+    if not ctx.meta['WINDOW']:
+        # Don't leave the windows of an earlier run around for the frontend to show
+        if os.path.exists('connections_windows.json'):
+            os.remove('connections_windows.json')
+        return
+
+    windows = get_review_windows(ctx.meta['WINDOW'], ctx.meta['SPAN'], ctx.meta['MIN_REVIEWS'])
+    # Every window shares the same node ids, so nodes keep their place while scrubbing
+    node_to_id_mapping = get_node_to_id_mapping(
+        [connection for window in windows for connection in window['connections']]
+    )
+    with open('connections_windows.json', mode='w') as f:
+        f.write(
+            json.dumps(
+                {
+                    "nodes": [
+                        {"data": {"id": v, "name": k}}
+                        for k, v in node_to_id_mapping.items()
+                    ],
+                    "windows": [
+                        {
+                            "start": window['start'],
+                            "end": window['end'],
+                            "edges": convert_cytoscape(
+                                window['connections'], node_to_id_mapping
+                            )["edges"],
+                        }
+                        for window in windows
+                    ],
+                }
+            )
+        )
+    print(f'✅ - Prepared {len(windows)} windows from frontend')
+
+
 def display_graph():
 
     print('🌐 - Serving on http://localhost:8080')
@@ -0,0 +1,172 @@
+import sqlite3
+import time
+
+import aiohttp
+import click
+import pytest
+
+import generate_visualisation
+from fake_graphql import FakeGraphQL
+
+
+def make_pull_requests(count, reviews=2):
+    return [
+        {
+            "author": {"login": "author{}".format(i % 3)},
+            "number": i + 1,
+            "createdAt": "2023-01-{:02d}T00:00:00Z".format(i % 28 + 1),
+            "updatedAt": "2023-02-{:02d}T00:00:00Z".format(i % 28 + 1),
+            "state": "MERGED",
+            "reviews": {
+                "nodes": [
+                    {
+                        "author": {"login": "reviewer{}".format(j)},
+                        "publishedAt": "2023-01-{:02d}T12:00:00Z".format(i % 28 + 1),
+                        "state": "APPROVED",
+                    }
+                    for j in range(reviews)
+                ]
+            },
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "token.pwd").write_text("token")
+    return tmp_path
+
+
+def fetch(server, repos, limit=10):
+    with click.Context(generate_visualisation.run) as ctx:
+        ctx.meta.update(REPOS=repos, LIMIT=limit, BEFORE=None, URL=server.url)
+        return list(generate_visualisation.paginate_reverse())
+
+
+def test_paginate_reverse_replays_every_page_of_every_repository():
+    pull_requests = {
+        "django/django": make_pull_requests(25),
+        "django/channels": make_pull_requests(7),
+    }
+    with FakeGraphQL(pull_requests, page_size=10) as server:
+        records = fetch(server, [("django", "django"), ("django", "channels")])
+
+    assert len(records) == (25 + 7) * 2
+    assert {record["repository"] for record in records} == {"django/django", "django/channels"}
+    assert len([record for record in records if record["repository"] == "django/django"]) == 50
+    # Three pages of django and one of channels
+    assert len(server.requests) == 4
+
+
+def test_waits_for_the_rate_limit_to_reset():
+    with FakeGraphQL(
+        {"django/django": make_pull_requests(40)}, page_size=10, limit=2, reset_seconds=0.5
+    ) as server:
+        start = time.perf_counter()
+        records = fetch(server, [("django", "django")])
+
+    assert len(records) == 80
+    assert server.statuses == [200] * 4
+    assert time.perf_counter() - start >= 0.5
+
+
+def test_waits_for_the_reset_on_a_403_for_running_out_of_credits():
+    with FakeGraphQL({"django/django": make_pull_requests(20)}, page_size=10) as server:
+        # Another client sharing the token used up the last of the credits
+        server.fail_next(
+            403,
+            {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time()))},
+            "API rate limit exceeded",
+        )
+        records = fetch(server, [("django", "django")])
+
+    assert len(records) == 40
+    assert server.statuses == [403, 200, 200]
+
+
+@pytest.mark.parametrize(
+    "status, headers, message",
+    [
+        (429, {"Retry-After": "0"}, "Too many requests"),
+        (403, {"Retry-After": "0"}, "You have exceeded a secondary rate limit"),
+        (403, {}, "You have exceeded a secondary rate limit"),
+    ],
+)
+def test_retries_secondary_rate_limits(monkeypatch, status, headers, message):
+    monkeypatch.setattr(generate_visualisation, "MAX_BACKOFF", 0)
+    with FakeGraphQL({"django/django": make_pull_requests(5)}) as server:
+        server.fail_next(status, headers, message)
+        server.fail_next(status, headers, message)
+        records = fetch(server, [("django", "django")])
+
+    assert len(records) == 10
+    assert server.statuses == [status, status, 200]
+
+
+def test_fails_straight_away_on_a_403_that_is_not_a_rate_limit():
+    with FakeGraphQL({"django/django": make_pull_requests(5)}) as server:
+        server.fail_next(403, message="Resource not accessible by integration")
+        with pytest.raises(aiohttp.ClientResponseError):
+            fetch(server, [("django", "django")])
+
+    assert server.statuses == [403]
+
+
+def test_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(generate_visualisation, "MAX_RETRIES", 2)
+    with FakeGraphQL({"django/django": make_pull_requests(5)}) as server:
+        for _ in range(3):
+            server.fail_next(429, {"Retry-After": "0"}, "Too many requests")
+        with pytest.raises(aiohttp.ClientResponseError):
+            fetch(server, [("django", "django")])
+
+    assert server.statuses == [429] * 3
+
+
+def sync(server, repos, limit=10):
+    with click.Context(generate_visualisation.run) as ctx:
+        ctx.meta.update(REPOS=repos, LIMIT=limit, URL=server.url)
+        generate_visualisation.sync_data()
+    conn = sqlite3.connect(generate_visualisation.DB_PATH)
+    rows = conn.execute(
+        "SELECT pr_number, pr_updated_at FROM pull_requests ORDER BY pr_number"
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def test_sync_picks_up_a_pull_request_updated_in_the_same_second():
+    pull_requests = make_pull_requests(3)
+    with FakeGraphQL({"django/django": pull_requests}, page_size=2) as server:
+        assert [number for number, _ in sync(server, [("django", "django")])] == [1, 2, 3]
+
+        # Opened in the same second as the last pull request synced was updated
+        last_updated_at = max(pr["updatedAt"] for pr in pull_requests)
+        pull_requests.append({**make_pull_requests(4)[3], "updatedAt": last_updated_at})
+        rows = sync(server, [("django", "django")])
+
+    assert rows[-1] == (4, last_updated_at)
+    assert len(rows) == 4
+
+
+def test_review_edges_match_the_reviews_after_a_sync():
+    pull_requests = make_pull_requests(6, reviews=3)
+    with FakeGraphQL({"django/django": pull_requests}, page_size=4) as server:
+        sync(server, [("django", "django")])
+        # Drop a reviewer from some pull requests and update them
+        for pull_request in pull_requests[:3]:
+            pull_request["reviews"]["nodes"].pop()
+            pull_request["updatedAt"] = "2023-03-01T00:00:00Z"
+        sync(server, [("django", "django")])
+
+    conn = sqlite3.connect(generate_visualisation.DB_PATH)
+    edges = conn.execute("SELECT * FROM review_edges ORDER BY 1, 2, 3").fetchall()
+    conn.execute("DROP TABLE review_edges")
+    generate_visualisation.create_review_edges(conn)
+    rebuilt = conn.execute("SELECT * FROM review_edges ORDER BY 1, 2, 3").fetchall()
+    conn.close()
+
+    assert edges == rebuilt
+    assert all(total > 0 for *_, total in edges)
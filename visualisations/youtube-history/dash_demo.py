@@ -1,20 +1,49 @@
 import base64
 import datetime
+import hashlib
 import io
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import dash
+import diskcache
+from dash import DiskcacheManager, dcc, html
 from dash.dependencies import Input, Output, State
-import dash_core_components as dcc
-import dash_html_components as html
-import dash_table
 
 import pandas as pd
 
+import takeout
 import visual_plot
 
+# Processed histories are kept here so that re-uploads only process what's new, dropping
+# the least recently saved ones once the store gets too big
+STORE_DIR = 'history_store'
+STORE_SIZE = 512 * 1024 * 1024
+
+# Figures of uploads already seen, by a hash of the uploaded file, dropping the least
+# recently used ones once the cache gets too big
+FIGURE_CACHE_DIR = os.path.join('cache', 'figures')
+FIGURE_CACHE_SIZE = 512 * 1024 * 1024
+# Bump this when a change to the processing changes the figures
+FIGURE_VERSION = 2
+figure_cache = diskcache.Cache(
+    FIGURE_CACHE_DIR,
+    size_limit=FIGURE_CACHE_SIZE,
+    eviction_policy='least-recently-used',
+)
+
+# Uploads are processed by background callbacks, each in its own process, so the server
+# stays responsive and uploads from different users don't wait for each other. Each
+# callback then spreads the files of its upload over a pool of processes
+background_callback_manager = DiskcacheManager(diskcache.Cache(os.path.join('cache', 'jobs')))
+
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
-app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
+app = dash.Dash(
+    __name__,
+    external_stylesheets=external_stylesheets,
+    background_callback_manager=background_callback_manager,
+)
 
 app.layout = html.Div([
     html.H1('YouTube History Visualisation'),
@@ -48,43 +77,134 @@ app.layout = html.Div([
         # Allow multiple files to be uploaded
         multiple=True
     ),
+    dcc.Checklist(
+        id='merge-uploads',
+        options=[{'label': 'Combine the uploaded files into one visualisation', 'value': 'merge'}],
+        value=[]
+    ),
+    html.Progress(id='upload-progress', value='0', max='1', style={'visibility': 'hidden'}),
     html.Div(id='output-data-upload'),
 ])
 
 
-def parse_contents(contents, filename, date):
+def store_path(df):
+    # Re-uploads of someone's history share its oldest entry, while newer entries are
+    # added on top, so use that to tell histories apart
+    oldest = df.loc[df['time'].idxmin()]
+    key = hashlib.sha256('{}|{}'.format(oldest['time'], oldest['title']).encode('utf-8'))
+    return os.path.join(STORE_DIR, '{}.pkl'.format(key.hexdigest()))
+
+
+def prune_store(keep):
+    """
+    Delete the least recently saved histories, other than the one at `keep`, until the
+    store fits in STORE_SIZE. Every upload saves its history, so those of people who
+    haven't been back for the longest go first.
+    """
+    histories = []
+    for entry in os.scandir(STORE_DIR):
+        if not entry.name.endswith('.pkl'):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            # Pruned by another process in the meantime
+            continue
+        histories.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in histories)
+    for _, size, path in sorted(histories):
+        if total <= STORE_SIZE:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def read_upload(contents, filename):
     content_type, content_string = contents.split(',')
     decoded = base64.b64decode(content_string)
+    if 'csv' in filename:
+        # Assume that the user uploaded a CSV file
+        return pd.read_csv(io.StringIO(decoded.decode('utf-8')))
+    elif 'xls' in filename:
+        # Assume that the user uploaded an excel file
+        return pd.read_excel(io.BytesIO(decoded))
+    elif 'json' in filename or 'html' in filename:
+        # Takeout watch history, either watch-history.json or watch-history.html
+        return takeout.read_watch_history(io.BytesIO(decoded), filename)
+    raise ValueError('Unsupported file type: {}'.format(filename))
+
+
+def figure_key(contents):
+    digest = hashlib.sha256(contents.encode('utf-8')).hexdigest()
+    return '{}-{}'.format(FIGURE_VERSION, digest)
+
+
+def process_upload(contents, filename, keep_model):
+    """
+    Work out the figure and number of entries of one upload, in a worker process. The
+    processed visualiser is returned as well when `keep_model` is set, so it can be
+    merged with the other uploads, otherwise None. Both are None if the file couldn't
+    be processed, e.g. if it has no entries.
+    """
+    key = figure_key(contents)
+    result = figure_cache.get(key)
+    if result is not None and not keep_model:
+        return result, None
     try:
-        if 'csv' in filename:
-            # Assume that the user uploaded a CSV file
-            df = pd.read_csv(io.StringIO(decoded.decode('utf-8')))
-        elif 'xls' in filename:
-            # Assume that the user uploaded an excel file
-            df = pd.read_excel(io.BytesIO(decoded))
-        elif 'json' in filename:
-            df = pd.read_json(io.StringIO(decoded.decode('utf-8')), orient='records')
+        df = read_upload(contents, filename)
+        if df.empty:
+            raise ValueError('No entries found in {}'.format(filename))
+        os.makedirs(STORE_DIR, exist_ok=True)
+        path = store_path(df)
+        model = visual_plot.HistoryVisualiser.from_store(df, path)
+        prune_store(keep=path)
+        if result is None:
+            result = {'figure': model.get_fig(seed=0, widget=False).to_dict(), 'entries': len(df)}
+            figure_cache.set(key, result)
     except Exception as e:
         print(e)
+        return None, None
+    return result, model if keep_model else None
+
+
+def render_upload(filename, date, result):
+    if result is None:
         return html.Div([
             'There was an error processing this file.'
         ])
-    model = visual_plot.HistoryVisualiser(df)
-    model.preprocess_df()
-    model.gen_ngrams()
-    fig = model.get_fig()
     return html.Div([
         html.Div([
             html.H2('Summary'),
             html.Plaintext('Loaded file: {}'.format(filename)),
             html.Plaintext('Time of Load: {}'.format(datetime.datetime.fromtimestamp(date))),
-            html.Plaintext('Found {} entries'.format(len(df))),
+            html.Plaintext('Found {} entries'.format(result['entries'])),
             html.H2('Visualisation'),
             html.Hr()  # horizontal line
         ]),
         dcc.Graph(
             id='test',
-            figure=fig
+            figure=result['figure']
+        )
+    ])
+
+
+def render_merged(filenames, models):
+    model = visual_plot.HistoryVisualiser.merge(models)
+    return html.Div([
+        html.Div([
+            html.H2('Combined Visualisation'),
+            html.Plaintext('Combined files: {}'.format(', '.join(filenames))),
+            html.Plaintext('Found {} entries'.format(len(model.df))),
+            html.Hr()  # horizontal line
+        ]),
+        dcc.Graph(
+            id='combined',
+            figure=model.get_fig(seed=0, widget=False)
         )
     ])
 
@@ -92,15 +212,43 @@ def parse_contents(contents, filename, date):
 @app.callback(Output('output-data-upload', 'children'),
               [Input('upload-data', 'contents')],
               [State('upload-data', 'filename'),
-               State('upload-data', 'last_modified')])
-def update_output(list_of_contents, list_of_names, list_of_dates):
+               State('upload-data', 'last_modified'),
+               State('merge-uploads', 'value')],
+              background=True,
+              progress=[Output('upload-progress', 'value'),
+                        Output('upload-progress', 'max')],
+              running=[(Output('upload-progress', 'style'),
+                        {'visibility': 'visible'},
+                        {'visibility': 'hidden'})])
+def update_output(set_progress, list_of_contents, list_of_names, list_of_dates, merge):
     if list_of_contents is not None:
+        merge = 'merge' in (merge or []) and len(list_of_contents) > 1
+        total = str(len(list_of_contents) + merge)
+        set_progress(('0', total))
+
+        # Process the files side by side rather than one after another
+        results = [None] * len(list_of_contents)
+        models = [None] * len(list_of_contents)
+        workers = min(len(list_of_contents), os.cpu_count())
+        with ProcessPoolExecutor(workers) as executor:
+            futures = {
+                executor.submit(process_upload, c, n, merge): i
+                for i, (c, n) in enumerate(zip(list_of_contents, list_of_names))}
+            for done, future in enumerate(as_completed(futures), 1):
+                i = futures[future]
+                results[i], models[i] = future.result()
+                set_progress((str(done), total))
+
         children = [
-            parse_contents(c, n, d) for c, n, d in
-            zip(list_of_contents, list_of_names, list_of_dates)]
+            render_upload(n, d, result) for n, d, result in
+            zip(list_of_names, list_of_dates, results)]
+        if merge:
+            merged = [(n, model) for n, model in zip(list_of_names, models) if model is not None]
+            if merged:
+                children.insert(0, render_merged(*zip(*merged)))
+            set_progress((total, total))
         return children
 
 
-
 if __name__ == '__main__':
     app.run_server(debug=True)
\ No newline at end of file
@@ -37,15 +37,14 @@
 # In[1]:
 
 
-import json
 import pandas as pd
 
-# Open History File as dataframe
+import takeout
+
+# Open History File as dataframe, reading only the title and time of each entry
 file = '../watch-history.json'
-with open(file, encoding='utf8') as wh_file:
-    wh_dict = json.load(wh_file)
-    
-wh = pd.DataFrame.from_dict(wh_dict)
+with open(file, 'rb') as wh_file:
+    wh = takeout.read_watch_history(wh_file, file)
 
 
 # In[2]:
@@ -100,12 +99,7 @@ wh.head()
 # In[6]:
 
 
-import datetime as dt
-
-def get_date(datetime_str):
-    return dt.datetime.strptime(datetime_str.split('T')[0], '%Y-%m-%d')
-
-wh['time'] = wh['time'].apply(lambda x: get_date(x))
+wh['time'] = wh['time'].dt.normalize()
 
 wh.head()
 
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""
+Read the YouTube watch history from a Google Takeout export, keeping only the title and
+time of each video watched.
+
+Both `watch-history.json` and `watch-history.html` are parsed incrementally, so the
+rest of each entry (urls, channels, products...) is never held in memory all at once.
+"""
+
+import codecs
+from html.parser import HTMLParser
+
+import ijson
+import pandas as pd
+
+HTML_CHUNK_SIZE = 1024 * 1024
+
+# "Jan 5, 2021, 10:12:34 PM" once the timezone has been dropped, as in exports of US
+# English accounts. Times in other formats, e.g. "5 Jan 2021, 22:12:34" from British
+# English accounts, are parsed more slowly one by one
+HTML_TIME_FORMAT = '%b %d, %Y, %I:%M:%S %p'
+# Share of the times that have to parse for an HTML export to be read
+HTML_MIN_PARSED = 0.5
+
+
+def iter_json(fp):
+    for entry in ijson.items(fp, 'item'):
+        yield entry.get('title'), entry.get('time')
+
+
+class _WatchHistoryParser(HTMLParser):
+    """
+    Collect the lines of text of each entry in `watch-history.html`, which looks like
+
+        <div class="content-cell ... mdl-typography--body-1">
+            Watched&nbsp;<a href="...">Video title</a><br>
+            <a href="...">Channel</a><br>
+            Jan 5, 2021, 10:12:34 PM GMT
+        </div>
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.entries = []
+        self._depth = 0
+        self._lines = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'br' and self._lines is not None:
+            self._lines.append('')
+        if tag != 'div':
+            return
+        if self._lines is not None:
+            self._depth += 1
+            return
+        classes = (dict(attrs).get('class') or '').split()
+        if (
+            'content-cell' in classes
+            and 'mdl-typography--body-1' in classes
+            and 'mdl-typography--text-right' not in classes
+        ):
+            self._lines = ['']
+            self._depth = 0
+
+    def handle_endtag(self, tag):
+        if tag != 'div' or self._lines is None:
+            return
+        if self._depth:
+            self._depth -= 1
+            return
+        lines = [line.strip() for line in self._lines if line.strip()]
+        self._lines = None
+        if len(lines) >= 2:
+            self.entries.append((lines[0], lines[-1]))
+
+    def handle_data(self, data):
+        if self._lines is not None:
+            self._lines[-1] += data
+
+
+def iter_html(fp):
+    parser = _WatchHistoryParser()
+    # Chunks can end part way through a multi-byte character
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        chunk = fp.read(HTML_CHUNK_SIZE)
+        if not chunk:
+            break
+        parser.feed(decoder.decode(chunk))
+        yield from parser.entries
+        parser.entries = []
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    yield from parser.entries
+
+
+def _parse_json_times(times):
+    # "2019-07-21T19:43:06.091Z" -> "2019-07-21T19:43:06"
+    return pd.to_datetime(times.str.slice(0, 19), format='%Y-%m-%dT%H:%M:%S')
+
+
+def _parse_html_times(times):
+    # Newer exports put a narrow no-break space before AM/PM, and the trailing timezone
+    # name can't be parsed by strptime
+    times = times.str.replace('\u202f', ' ', regex=False).str.rsplit(' ', n=1).str[0]
+    parsed = pd.to_datetime(times, format=HTML_TIME_FORMAT, errors='coerce')
+    failed = parsed.isna()
+    if failed.any():
+        parsed[failed] = pd.to_datetime(times[failed], format='mixed', errors='coerce')
+        failed = parsed.isna()
+    if len(times) and failed.mean() > 1 - HTML_MIN_PARSED:
+        raise ValueError(
+            'Could not parse {} of {} watch times, e.g. {!r}, the export may be in a '
+            'language that isn\'t supported'.format(
+                failed.sum(), len(times), times[failed].iloc[0]))
+    return parsed
+
+
+def read_watch_history(fp, filename):
+    """
+    Read the watch history from `fp`, a file opened in binary mode, as a dataframe of
+    `title` and `time`. `filename` tells the JSON and HTML exports apart.
+
+    Titles keep their "Watched " prefix, as in the JSON export, and are stored as
+    categories since the same videos tend to be watched more than once. Times are
+    stored to the second. Entries of an HTML export whose time can't be parsed are
+    dropped, and a ValueError is raised if that's most of them.
+    """
+    if filename.endswith('.html'):
+        entries, parse_times = iter_html(fp), _parse_html_times
+    else:
+        entries, parse_times = iter_json(fp), _parse_json_times
+
+    titles = []
+    times = []
+    for title, time in entries:
+        if title is None or time is None:
+            continue
+        titles.append(title.replace('\xa0', ' '))
+        times.append(time)
+
+    wh = pd.DataFrame({
+        'title': pd.Categorical(titles),
+        'time': parse_times(pd.Series(times, dtype=object)).astype('datetime64[s]'),
+    })
+    return wh[wh['time'].notna()].reset_index(drop=True)
@@ -0,0 +1,76 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+
+import takeout
+
+
+def make_html(times):
+    cells = "".join(
+        '<div class="outer-cell mdl-cell">'
+        '<div class="content-cell mdl-cell mdl-typography--body-1">'
+        'Watched\xa0<a href="https://www.youtube.com/watch?v={0}">Video {0}</a><br>'
+        '<a href="https://www.youtube.com/channel/{0}">Channel {0}</a><br>'
+        "{1}"
+        "</div>"
+        '<div class="content-cell mdl-cell mdl-typography--body-1 mdl-typography--text-right">'
+        "</div>"
+        "</div>".format(i, time)
+        for i, time in enumerate(times)
+    )
+    return io.BytesIO("<html><body>{}</body></html>".format(cells).encode("utf-8"))
+
+
+def test_read_watch_history_json():
+    history = [
+        {"title": "Watched Video 0", "time": "2021-01-05T22:12:34.091Z"},
+        {"title": "Watched Video 1", "time": "2021-01-04T08:00:00Z"},
+        # Entries without a time, e.g. ads, are left out
+        {"title": "Watched Video 2"},
+    ]
+    fp = io.BytesIO(json.dumps(history).encode("utf-8"))
+
+    wh = takeout.read_watch_history(fp, "watch-history.json")
+
+    assert list(wh["title"]) == ["Watched Video 0", "Watched Video 1"]
+    assert list(wh["time"]) == [
+        pd.Timestamp("2021-01-05 22:12:34"),
+        pd.Timestamp("2021-01-04 08:00:00"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "time",
+    [
+        # US English, older and newer exports
+        "Jan 5, 2021, 10:12:34 PM GMT",
+        "Jan 5, 2021, 10:12:34\u202fPM GMT",
+        # British English
+        "5 Jan 2021, 22:12:34 GMT",
+    ],
+)
+def test_read_watch_history_html(time):
+    wh = takeout.read_watch_history(make_html([time] * 3), "watch-history.html")
+
+    assert list(wh["title"]) == ["Watched Video 0", "Watched Video 1", "Watched Video 2"]
+    assert (wh["time"] == pd.Timestamp("2021-01-05 22:12:34")).all()
+
+
+def test_read_watch_history_html_in_both_formats():
+    times = ["Jan 5, 2021, 10:12:34 PM GMT", "6 Jan 2021, 08:00:00 GMT", "Not a time"]
+
+    wh = takeout.read_watch_history(make_html(times), "watch-history.html")
+
+    assert list(wh["time"]) == [
+        pd.Timestamp("2021-01-05 22:12:34"),
+        pd.Timestamp("2021-01-06 08:00:00"),
+    ]
+
+
+def test_read_watch_history_html_in_an_unknown_format():
+    times = ["5 janv. 2021, 22:12:34 UTC", "6 janv. 2021, 08:00:00 UTC"]
+
+    with pytest.raises(ValueError, match="Could not parse 2 of 2 watch times"):
+        takeout.read_watch_history(make_html(times), "watch-history.html")
@@ -0,0 +1,94 @@
+import random
+from collections import Counter
+
+import pandas as pd
+import pytest
+
+from visual_plot import HistoryVisualiser, _plural_merges
+
+# Singulars and plurals, some of which chain, e.g. "bu" -> "bus" -> "buss", and
+# stopwords that are left out
+WORDS = [
+    "cat", "cats", "dog", "dogs", "bu", "bus", "buss", "game", "games", "glass",
+    "glasses", "minecraft", "lets", "play", "plays", "review", "reviews", "the", "and",
+]
+
+
+def make_history(count, seed=0, start="2021-01-01"):
+    """A raw watch history as in watch-history.json, newest entries first."""
+    rng = random.Random(seed)
+    times = pd.date_range(start, periods=count, freq="7h")
+    return pd.DataFrame({
+        "title": [
+            "Watched " + " ".join(rng.choices(WORDS, k=rng.randint(2, 6))).title() + "!"
+            for _ in range(count)
+        ],
+        "time": times.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+    }).iloc[::-1].reset_index(drop=True)
+
+
+def fresh(df):
+    return HistoryVisualiser(df).preprocess_df().gen_ngrams()
+
+
+def stats(model):
+    return model.keyword_stats(n=None).sort_values("keyword").reset_index(drop=True)
+
+
+def test_update_matches_a_fresh_build(tmp_path):
+    history = make_history(300)
+    path = tmp_path / "history.pkl"
+
+    # An older export, then the full one with 100 more recent entries on top
+    HistoryVisualiser.from_store(history.iloc[100:], path)
+    model = HistoryVisualiser.from_store(history, path)
+
+    assert len(model.df) == 300
+    assert model.bag_1_2 == fresh(history).bag_1_2
+    pd.testing.assert_frame_equal(stats(model), stats(fresh(history)))
+
+
+def test_load_without_a_store(tmp_path):
+    assert HistoryVisualiser.load(tmp_path / "history.pkl") is None
+
+
+def test_merge_matches_a_fresh_build():
+    first = make_history(200, seed=1, start="2021-01-01")
+    second = make_history(150, seed=2, start="2022-01-01")
+
+    model = HistoryVisualiser.merge([fresh(first), fresh(second)])
+
+    combined = pd.concat([first, second], ignore_index=True)
+    assert model.bag_1_2 == fresh(combined).bag_1_2
+    pd.testing.assert_frame_equal(stats(model), stats(fresh(combined)))
+
+
+def merge_in_turn(rows):
+    """Merge singulars and plurals by rewriting every row once per pair, as gen_ngrams did."""
+    bag_1 = Counter(word for row in rows for word in row)
+    remove_words = []
+    for word, _ in bag_1.most_common(1000):
+        if word.endswith("s"):
+            singular, plural = word[:-1], word
+        else:
+            singular, plural = word, word + "s"
+        if plural in bag_1 and singular in bag_1:
+            if bag_1[plural] >= bag_1[singular]:
+                remove_words.append((singular, plural))
+            else:
+                remove_words.append((plural, singular))
+    for removed, added in remove_words:
+        rows = [[added if word == removed else word for word in row] for row in rows]
+    return rows
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_plural_merges_match_merging_in_turn(seed):
+    rng = random.Random(seed)
+    words = ["bu", "bus", "buss", "busss", "ca", "cas", "cass", "dog", "dogs"]
+    weights = [rng.randint(1, 10) for _ in words]
+    rows = [rng.choices(words, weights, k=rng.randint(1, 5)) for _ in range(50)]
+
+    merges = _plural_merges(Counter(word for row in rows for word in row))
+
+    assert [[merges.get(word, word) for word in row] for row in rows] == merge_in_turn(rows)
@@ -1,15 +1,15 @@
 #!/usr/bin/env python
 
+import os
 import string
+import hashlib
 import json
-import datetime as dt
-import functools
-import operator
 import random
-from datetime import timedelta
-from collections import Counter
+import heapq
+from collections import Counter, deque
 
 
+import numpy as np
 import pandas as pd
 import nltk
 import plotly.offline as py
@@ -19,8 +19,26 @@ from nltk.corpus import stopwords
 nltk.download('stopwords')
 stop_words = stopwords.words('english')
 
-def _get_date(datetime_str):
-    return dt.datetime.strptime(datetime_str.split('T')[0], '%Y-%m-%d')
+# Keywords that say nothing about what was watched, left out of the statistics
+REMOVALS = []
+REMOVALS.extend([str(x) for x in list(range(100))])
+REMOVALS.extend(["one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten"])
+REMOVALS.extend(["video", "trailer", "new", "best", "official", "removed", "music", "ft", "feat"])
+REMOVALS.extend(['official video', 'official trailer', 'music video', 'official music'])
+REMOVALS = frozenset(REMOVALS)
+
+PALETTE = ['darkturquoise', 'darkorange', 'darkorchid', 'mediumseagreen', 'royalblue', 'saddlebrown', 'tomato']
+
+# Size of the plot, in pixels, and width of a character relative to the font size, that
+# the seeded layout assumes when working out where labels overlap
+LAYOUT_WIDTH = 1000
+LAYOUT_HEIGHT = 600
+CHAR_WIDTH = 0.6
+# Heights tried for each label before giving up on finding a free spot
+LAYOUT_TRIES = 50
+
+# Deletes punctuation and leaves spaces as they are
+_PUNCTUATION_TABLE = str.maketrans(' ', ' ', string.punctuation)
 
 def _find_ngrams(input_list, n):
     if n > 1:
@@ -36,16 +54,115 @@ def _get_counter_from_column(df, column_name):
             ct[element] += 1
     return ct
 
-def _replace_count(counter, removed, added):
-    counter[added] += counter[removed]
-    del counter[removed]
+# Pick singular or plural for most common X words, as a dict of each word removed to
+# the word it's merged into
+def _plural_merges(bag_1):
+    merges = {}
+    for word in bag_1.most_common(1000):
+        word = word[0]
+        if word.endswith('s'):
+            singular = word[:-1]
+            plural = word
+        else:
+            singular = word
+            plural = word + 's'
+        if plural in bag_1 and singular in bag_1:
+            if bag_1[plural] >= bag_1[singular]:
+                removed, added = singular, plural
+            else:
+                removed, added = plural, singular
+            # Words already merged into the removed word follow it, as they would if
+            # each merge was applied to the rows in turn
+            for merged_word, target in merges.items():
+                if target == removed:
+                    merges[merged_word] = added
+            merges.setdefault(removed, added)
+    return merges
+
+def _merge_counter(counter, merge):
+    merged = Counter()
+    for ngram, count in counter.items():
+        merged[merge(ngram)] += count
+    return merged
+
+# Map each n-gram to the positions of the rows it appears in
+def _build_index(ngram_lists):
+    index = {}
+    for position, ngrams in enumerate(ngram_lists):
+        for ngram in set(ngrams):
+            index.setdefault(ngram, []).append(position)
+    return {ngram: np.array(positions) for ngram, positions in index.items()}
+
+def _merge_index(index, merge):
+    merged = {}
+    for ngram, positions in index.items():
+        target = merge(ngram)
+        if target in merged:
+            merged[target] = np.union1d(merged[target], positions)
+        else:
+            merged[target] = positions
+    return merged
+
+def _keyword_label(keyword):
+    return keyword if isinstance(keyword, str) else " ".join(keyword)
+
+# Number the week, starting on Mondays, or the month of days given as days since the epoch
+def _period_numbers(days, period):
+    if period == 'W':
+        return (days + 3) // 7
+    if period == 'M':
+        return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    raise ValueError("period must be 'W' or 'M', not {!r}".format(period))
+
+def _period_start(number, period):
+    if period == 'W':
+        return pd.Timestamp(np.datetime64(number * 7 - 3, 'D'))
+    return pd.Timestamp(np.datetime64(number, 'M'))
+
+# Pick a colour for a keyword that stays the same between runs, unlike hash()
+def _keyword_colour(keyword):
+    digest = hashlib.md5(keyword.encode('utf-8')).digest()
+    return PALETTE[int.from_bytes(digest[:4], 'big') % len(PALETTE)]
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+# Cells of the grid that a box (x0, y0, x1, y1) covers
+def _grid_cells(box, cell):
+    for i in range(int(box[0] // cell), int(box[2] // cell) + 1):
+        for j in range(int(box[1] // cell), int(box[3] // cell) + 1):
+            yield i, j
+
+# Pick a height between 0 and 1 for labels centred on `xs`, in the order given, so that
+# they don't overlap the labels placed before them. Placed labels are kept in a grid of
+# cells at least as big as any label, so only labels in the same cells are checked
+def _place_labels(xs, widths, heights, rng, tries=LAYOUT_TRIES):
+    cell = max(max(widths, default=0), max(heights, default=0), 1e-3)
+    grid = {}
+    boxes = []
+    ys = []
+    for x, width, height in zip(xs, widths, heights):
+        for _ in range(tries):
+            y = rng.uniform(min(height, 1) / 2, 1 - min(height, 1) / 2)
+            box = (x - width / 2, y - height / 2, x + width / 2, y + height / 2)
+            nearby = {k for c in _grid_cells(box, cell) for k in grid.get(c, ())}
+            if not any(_overlaps(box, boxes[k]) for k in nearby):
+                break
+        # If there was no free spot the label overlaps at the last height tried
+        for c in _grid_cells(box, cell):
+            grid.setdefault(c, []).append(len(boxes))
+        boxes.append(box)
+        ys.append(y)
+    return ys
+
+def _append_index(index, other, offset):
+    for ngram, positions in other.items():
+        positions = positions + offset
+        if ngram in index:
+            index[ngram] = np.concatenate([index[ngram], positions])
+        else:
+            index[ngram] = positions
 
-def _avg_datetime(series):
-    dt_min = series.min()
-    deltas = [(x - dt_min).days for x in series]
-    if len(deltas) == 0:
-        print(series)
-    return dt_min + timedelta(functools.reduce(operator.add, deltas) // len(deltas))
 
 class HistoryVisualiser:
 
@@ -53,6 +170,91 @@ class HistoryVisualiser:
 
         self.df = df
 
+    @classmethod
+    def load(cls, path):
+        """
+        Load a visualiser saved with `save`, with its processed rows and raw n-gram
+        counters, or return None if there isn't one at `path`.
+        """
+        if not os.path.exists(path):
+            return None
+        state = pd.read_pickle(path)
+        model = cls(state.pop('df'))
+        for name, value in state.items():
+            setattr(model, name, value)
+        model._merge_ngrams()
+        return model
+
+    def save(self, path):
+        # Write to a temporary file first so that other processes loading the same
+        # history never read a half written file
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        pd.to_pickle({
+            'df': self.df,
+            'raw_bag_1': self.raw_bag_1,
+            'raw_bag_2': self.raw_bag_2,
+            'raw_index_1': self.raw_index_1,
+            'raw_index_2': self.raw_index_2,
+        }, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def from_store(cls, df, path):
+        """
+        Process the raw history `df`, reusing the work saved at `path` by an earlier
+        upload of the same history so that only the new entries are tokenised, and save
+        the result back to `path`.
+        """
+        model = cls.load(path)
+        if model is None:
+            model = cls(df).preprocess_df().gen_ngrams()
+        else:
+            model.update(df)
+        model.save(path)
+        return model
+
+    @classmethod
+    def merge(cls, models):
+        """
+        Combine processed visualisers of several histories, e.g. of different people or
+        different years, into one without tokenising anything again. The histories are
+        assumed not to share any entries.
+        """
+        merged = cls(models[0].df)
+        merged.raw_bag_1 = Counter(models[0].raw_bag_1)
+        merged.raw_bag_2 = Counter(models[0].raw_bag_2)
+        merged.raw_index_1 = dict(models[0].raw_index_1)
+        merged.raw_index_2 = dict(models[0].raw_index_2)
+        for model in models[1:]:
+            merged._append(model)
+        merged._merge_ngrams()
+
+        return merged
+
+    def update(self, df):
+        """
+        Add the entries of the raw history `df` that were watched after every entry seen
+        so far. Exports list the newest videos first and repeat everything watched
+        before, so only the new entries are tokenised and counted.
+        """
+        new = HistoryVisualiser(df).preprocess_df()
+        if len(self.df):
+            new.df = new.df[new.df['watched_at'] > self.df['watched_at'].max()]
+        new._tokenise()
+        self._append(new)
+        self._merge_ngrams()
+
+        return self
+
+    def _append(self, other):
+        # Rows of `other` go after the rows already here, so its row positions move along
+        offset = len(self.df)
+        self.df = pd.concat([self.df, other.df], ignore_index=True)
+        self.raw_bag_1.update(other.raw_bag_1)
+        self.raw_bag_2.update(other.raw_bag_2)
+        _append_index(self.raw_index_1, other.raw_index_1, offset)
+        _append_index(self.raw_index_2, other.raw_index_2, offset)
+
     def preprocess_df(self):
 
         wh = self.df
@@ -60,24 +262,24 @@ class HistoryVisualiser:
         # Drop columns except title and time
         wh = wh[['title', 'time']]
 
-        # Remove expired videos
-        len(wh[wh['title'].str.startswith('Watched https://www.youtube.com')]) / len(wh)
-
         # Remove "Watched" from title "Watched Cat Video" -> "Cat Video"
-        wh['title'] = wh['title'].apply(lambda x: x[7:])
+        wh = wh.assign(title=wh['title'].str.slice(7))
 
         # Remove Unavailable videos
-        wh = wh.drop(wh[wh['title'].str.startswith('https://www.youtube.com')].index)
-
-        # Lower Case "Cat Video" -> "cat video"
-        wh['title'] = wh['title'].apply(lambda x: x.lower())
+        wh = wh[~wh['title'].str.startswith('https://www.youtube.com', na=False)]
 
-        # Remove whitespace
-        wh['title'] = wh['title'].apply(lambda x: x.strip())
-        wh['title'] = wh['title'].apply(
-            lambda x: x.translate(str.maketrans(' ', ' ', string.punctuation)))
+        # Lower case, remove whitespace and punctuation "Cat Video! " -> "cat video"
+        wh = wh.assign(
+            title=wh['title'].str.lower().str.strip().str.translate(_PUNCTUATION_TABLE))
 
-        wh['time'] = wh['time'].apply(lambda x: _get_date(x))
+        # Parse "2019-07-21T19:43:06.091Z", unless the times were already parsed by
+        # takeout.read_watch_history, keeping the full time in watched_at and the date
+        # in time
+        watched_at = wh['time']
+        if not pd.api.types.is_datetime64_any_dtype(watched_at):
+            watched_at = pd.to_datetime(
+                watched_at.str.slice(0, 19), format='%Y-%m-%dT%H:%M:%S')
+        wh = wh.assign(time=watched_at.dt.normalize(), watched_at=watched_at)
 
         self.df = wh
 
@@ -85,34 +287,41 @@ class HistoryVisualiser:
 
     def gen_ngrams(self):
 
+        self._tokenise()
+        self._merge_ngrams()
+
+        return self
+
+    def _tokenise(self):
+
         wh = self.df
 
         # Split words and remove stopwords
         wh['unigrams'] = wh['title'].apply(lambda x: [word for word in x.split(' ') if word not in stop_words and word != ''])
         wh['bigrams'] = wh['unigrams'].apply(lambda x: list(_find_ngrams(x, 2)))
 
-        bag_1 = _get_counter_from_column(wh, 'unigrams')
-        bag_2 = _get_counter_from_column(wh, 'bigrams')
+        # Counts and row positions of the n-grams before singulars and plurals are merged
+        self.raw_bag_1 = _get_counter_from_column(wh, 'unigrams')
+        self.raw_bag_2 = _get_counter_from_column(wh, 'bigrams')
+        self.raw_index_1 = _build_index(wh['unigrams'])
+        self.raw_index_2 = _build_index(wh['bigrams'])
 
-        # Pick singular or plural for most common X words
-        remove_words = []
-        for word in bag_1.most_common(1000):
-            word = word[0]
-            if word.endswith('s'):
-                singular = word[:-1]
-                plural = word
-            else:
-                singular = word
-                plural = word + 's'
-            if plural in bag_1 and singular in bag_1:
-                if bag_1[plural] >= bag_1[singular]:
-                    remove_words.append((singular, plural))
-                else:
-                    remove_words.append((plural, singular))
-
-        for (removed, added) in remove_words:
-            _replace_count(bag_1, removed, added)
-            wh['unigrams'] = wh['unigrams'].apply(lambda x: [added if unigram == removed else unigram for unigram in x])
+    def _merge_ngrams(self):
+
+        # Merges are applied to the vocabulary rather than to every row, bigrams
+        # included, so each n-gram is only looked at once
+        merges = _plural_merges(self.raw_bag_1)
+
+        def merge_unigram(unigram):
+            return merges.get(unigram, unigram)
+
+        def merge_bigram(bigram):
+            return (merge_unigram(bigram[0]), merge_unigram(bigram[1]))
+
+        bag_1 = _merge_counter(self.raw_bag_1, merge_unigram)
+        bag_2 = _merge_counter(self.raw_bag_2, merge_bigram)
+        index_1 = _merge_index(self.raw_index_1, merge_unigram)
+        index_2 = _merge_index(self.raw_index_2, merge_bigram)
 
         THRESHOLD = 0.3
 
@@ -125,56 +334,168 @@ class HistoryVisualiser:
             else:
                 del bag_2[bigram[0]]
 
-        wh['ngrams'] = wh['unigrams'] + wh['bigrams']
         self.bag_1_2 = (bag_1 + bag_2)
+        self.index = {**index_1, **index_2}
+
+    def top_keywords(self, n=100):
+        # Most common keywords, other than the removals, as they are in bag_1_2, or all
+        # of them if `n` is None
+        candidates = self.bag_1_2.most_common(None if n is None else n + len(REMOVALS))
+        keywords = [k for k, _ in candidates if _keyword_label(k) not in REMOVALS]
+        return keywords[:n]
+
+    def keyword_table(self, n=100):
+        """
+        Explode the `n` most common keywords into one row per keyword and entry it
+        appears in, with the day of the entry as days since the epoch.
+        """
+        keywords = self.top_keywords(n)
+        positions = [self.index[keyword] for keyword in keywords]
+        codes = np.repeat(np.arange(len(keywords)), [len(p) for p in positions])
+        rows = np.concatenate(positions) if positions else np.array([], dtype=np.int64)
+        days = self.df['time'].values.astype('datetime64[D]').astype(np.int64)
+        return pd.DataFrame({
+            'keyword': pd.Categorical.from_codes(codes, [_keyword_label(k) for k in keywords]),
+            'day': days[rows],
+        })
+
+    def keyword_stats(self, n=100):
+        """
+        Number of entries, mean date (rounded down to a whole day), and first and last
+        date seen of each of the `n` most common keywords, most common first.
+        """
+        table = self.keyword_table(n)
+        stats = table.groupby('keyword', observed=True, sort=False)['day'].agg(
+            freq='size', day_sum='sum', first='min', last='max')
+        return pd.DataFrame({
+            'keyword': stats.index.astype(str),
+            'avg_datetime': pd.to_datetime(stats['day_sum'] // stats['freq'], unit='D'),
+            'first_seen': pd.to_datetime(stats['first'], unit='D'),
+            'last_seen': pd.to_datetime(stats['last'], unit='D'),
+            'freq': stats['freq'],
+        }).reset_index(drop=True)
+
+    def keyword_histogram(self, n=100):
+        """
+        Number of entries per month of each of the `n` most common keywords, as a
+        dataframe of keywords by months.
+        """
+        table = self.keyword_table(n)
+        months = table['day'].values.astype('datetime64[D]').astype('datetime64[M]')
+        return table.groupby(
+            [table['keyword'], pd.Series(months, name='month')], observed=True, sort=False
+        ).size().unstack(fill_value=0).sort_index(axis=1)
+
+    def get_trending(self, period='W', window=4, n=10, min_count=3):
+        """
+        Find the keywords bursting in each week (`period='W'`) or month (`'M'`). A
+        keyword seen `count` times in a period is scored against its mean count over the
+        `window` periods before as (count - mean) / sqrt(mean + 1).
+
+        Returns a dataframe of the `n` highest scoring keywords of each period, out of
+        those seen at least `min_count` times in it, with the period's first day.
+        """
+        table = self.keyword_table(None)
+        keywords = table['keyword'].cat.categories
+        columns = ['period', 'keyword', 'count', 'mean', 'score']
+        if not len(table):
+            return pd.DataFrame([], columns=columns)
+
+        # Count each keyword per period in one go, sorted by period then keyword
+        periods = _period_numbers(table['day'].values, period)
+        pairs, counts = np.unique(
+            periods * len(keywords) + table['keyword'].cat.codes.values, return_counts=True)
+        pair_periods = pairs // len(keywords)
+        pair_codes = pairs % len(keywords)
+        first, last = pair_periods[0], pair_periods[-1]
+        bounds = np.searchsorted(pair_periods, np.arange(first, last + 2))
+
+        # Slide the window along one period at a time, keeping a running total of the
+        # counts in it rather than adding the window up again for every period
+        history = deque()
+        totals = Counter()
+        rows = []
+        for i, number in enumerate(range(first, last + 1)):
+            lo, hi = bounds[i], bounds[i + 1]
+            current = dict(zip(pair_codes[lo:hi].tolist(), counts[lo:hi].tolist()))
+
+            if len(history) == window:
+                scored = []
+                for code, count in current.items():
+                    if count >= min_count:
+                        mean = totals[code] / window
+                        scored.append(((count - mean) / np.sqrt(mean + 1), code, count, mean))
+                start = _period_start(number, period)
+                for score, code, count, mean in heapq.nlargest(n, scored):
+                    if score > 0:
+                        rows.append((start, keywords[code], count, mean, score))
+
+            history.append(current)
+            totals.update(current)
+            if len(history) > window:
+                for code, count in history.popleft().items():
+                    totals[code] -= count
+                    if not totals[code]:
+                        del totals[code]
+
+        return pd.DataFrame(rows, columns=columns)
+
+    def get_fig(self, n=100, seed=None, widget=True):
+        """
+        Plot the `n` most common keywords at their mean date, sized by frequency.
+
+        With a `seed` the layout is the same on every run: heights come from a seeded
+        generator, labels are moved so they don't overlap, and colours are picked from
+        the keyword. Otherwise heights and colours are random. `widget=False` returns a
+        plain `go.Figure`, which is much lighter to serialise than a `go.FigureWidget`.
+        """
+        data = self.keyword_stats(n)
 
-        return self
-
-    def get_fig(self):
-
-        wh = self.df
-
-        N = 100
-        data = pd.DataFrame([], columns=['keyword', 'avg_datetime', 'freq'])
-        for ngram in list(self.bag_1_2.most_common(N)):
-            keyword = ngram[0]
-            dates = wh[wh['ngrams'].apply(lambda x: (True if keyword in x else False))]['time']
-            data = data.append({
-                'keyword': keyword if isinstance (keyword, str) else " ".join(keyword),
-                'avg_datetime': _avg_datetime(dates),
-                'freq': len(dates)
-            }, ignore_index=True)
-
-        REMOVALS = []
-        REMOVALS.extend([str(x) for x in list(range(100))])
-        REMOVALS.extend(["one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten"])
-        REMOVALS.extend(["video", "trailer", "new", "best", "official", "removed", "music", "ft", "feat"])
-        REMOVALS.extend(['official video', 'official trailer', 'music video', 'official music'])
         zoom_factor = 3.5
-        data = data.drop(data[data['keyword'].isin(REMOVALS)].index)
-        print("before drop {}".format(len(data)))
         data = data[data.freq > zoom_factor]
-        print("before drop {}".format(len(data)))
         # Plot
 
-        palette = ['darkturquoise', 'darkorange', 'darkorchid', 'mediumseagreen', 'royalblue', 'saddlebrown', 'tomato']
-        plotly_colors = [palette[random.randrange(0, len(palette))] for i in range(N)]
+        text = [x.upper() for x in data["keyword"]]
+        sizes = [x // zoom_factor for x in list(data["freq"])]
+        layout = {}
+        if seed is None:
+            plotly_colors = [PALETTE[random.randrange(0, len(PALETTE))] for i in range(n)]
+            y = [random.uniform(0, 1) for x in range(len(data))]
+        else:
+            plotly_colors = [_keyword_colour(x) for x in data["keyword"]]
+            days = data["avg_datetime"].values.astype('datetime64[D]').astype(np.int64)
+            xs = np.zeros(len(days))
+            if len(days):
+                xs = (days - days.min()) / max(days.max() - days.min(), 1)
+            widths = [len(t) * s * CHAR_WIDTH / LAYOUT_WIDTH for t, s in zip(text, sizes)]
+            heights = [s / LAYOUT_HEIGHT for s in sizes]
+            # Place the biggest labels first so they get the free spots
+            order = sorted(range(len(text)), key=lambda i: -sizes[i])
+            placed = _place_labels(
+                [xs[i] for i in order], [widths[i] for i in order], [heights[i] for i in order],
+                random.Random(seed))
+            y = [0] * len(text)
+            for i, position in zip(order, placed):
+                y[i] = position
+            layout = {'yaxis': {'range': [0, 1]}}
 
         trace = go.Scatter(
             x = data["avg_datetime"],
-            y = [random.uniform(0, 1) for x in range(len(data))],
+            y = y,
             mode = "text",
-            text = [x.upper() for x in data["keyword"]],
+            text = text,
             opacity=0.75,
             textfont={
-                'size': [x // zoom_factor for x in list(data["freq"])],
+                'size': sizes,
                 'color': plotly_colors,
                 'family': "'Oswald', sans-serif"
             }
         )
 
         plot_data = [trace]
-        fig = go.FigureWidget(data=plot_data)
+        if widget:
+            fig = go.FigureWidget(data=plot_data, layout=layout)
+        else:
+            fig = go.Figure(data=plot_data, layout=layout)
 
         return fig
-